@@ -0,0 +1,221 @@
+# batch.py
+"""批处理: 将目录、通配符或文件列表中的图片逐个送入场景
+
+场景中的第一个图像输入节点依次接收每个文件, 图像输出节点的结果写入输出目录。
+解码、计算、编码在三个线程中流水执行, 阶段之间是有界队列, 同时在途的图片数量有上限,
+内存占用不随文件数量增长。单个文件失败不影响其余文件, 最后汇总每个文件的结果。
+"""
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from graph import Graph
+from graph_model import load_graph_model
+from kernels import load_image, save_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".npy")
+QUEUE_SIZE = 4  # 每个阶段之间最多等待的图片数
+_DONE = object()  # 队列结束标记
+
+
+def expand_inputs(patterns):
+    """展开输入: 目录取其中的图片文件, 通配符按匹配结果, 其余视为文件路径; 保持顺序并去重"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern]
+        files.extend(matches)
+    return list(dict.fromkeys(files))
+
+
+class BatchResult:
+    """单个文件的处理结果"""
+    def __init__(self, path):
+        self.path = path
+        self.outputs = []  # 写出的文件
+        self.stage = None  # 失败的阶段: decode / compute / encode
+        self.error = None
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def fail(self, stage, error):
+        self.stage = stage
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            "file": self.path,
+            "ok": self.ok,
+            "stage": self.stage,
+            "error": self.error,
+            "outputs": self.outputs,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def _put(target, item, stop):
+    """放入有界队列, 队列满时等待, 停止后放弃"""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    """从队列取出, 停止后返回结束标记"""
+    while not stop.is_set():
+        try:
+            return source.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+class BatchRunner:
+    def __init__(self, scene_path, output_dir, workers=1, fuse=True, ext=".png", queue_size=QUEUE_SIZE):
+        self.model = load_graph_model(scene_path)
+        sources = [
+            node for node in self.model.nodes
+            if not node.input_sockets and any(socket.datatype == 1 for socket in node.output_sockets)
+        ]
+        if not sources:
+            raise ValueError("场景中没有图像输入节点")
+        self.source = sources[0]
+        self.outputs = [
+            (index, node) for index, node in enumerate(self.model.output_nodes())
+            if node.input_sockets and node.input_sockets[0].datatype == 1
+        ]
+        # 文件之间只有源图像变化, 同一个Graph反复执行
+        self.graph = Graph(self.model, workers=workers, demand_driven=True, fuse_nodes=fuse)
+        self.output_dir = output_dir
+        self.ext = ext if ext.startswith(".") else "." + ext
+        self.queue_size = queue_size
+
+    def output_path(self, path, index):
+        """输出文件名: 输入的文件名, 有多个图像输出时附加输出序号"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if len(self.outputs) > 1:
+            stem = f"{stem}_{index}"
+        return os.path.join(self.output_dir, stem + self.ext)
+
+    def decode(self, files, decoded, stop):
+        for path in files:
+            result = BatchResult(path)
+            started = time.perf_counter()
+            image = None
+            try:
+                image = load_image(path)
+            except Exception as e:
+                result.fail("decode", e)
+            result.seconds += time.perf_counter() - started
+            if not _put(decoded, (result, image), stop):
+                return
+        _put(decoded, _DONE, stop)
+
+    def compute(self, decoded, encoded, stop):
+        while True:
+            item = _get(decoded, stop)
+            if item is _DONE:
+                _put(encoded, _DONE, stop)
+                return
+            result, image = item
+            images = []
+            if result.ok:
+                started = time.perf_counter()
+                try:
+                    self.source.output_sockets[0].param = image
+                    self.graph.execute()
+                    images = [(index, node.input_sockets[0].value) for index, node in self.outputs]
+                except Exception as e:
+                    result.fail("compute", e)
+                result.seconds += time.perf_counter() - started
+            image = None
+            if not _put(encoded, (result, images), stop):
+                return
+
+    def encode(self, encoded, results, stop):
+        while True:
+            item = _get(encoded, stop)
+            if item is _DONE:
+                _put(results, _DONE, stop)
+                return
+            result, images = item
+            started = time.perf_counter()
+            try:
+                for index, image in images:
+                    if image is None:
+                        continue
+                    path = self.output_path(result.path, index)
+                    save_image(image, path)
+                    result.outputs.append(path)
+            except Exception as e:
+                result.fail("encode", e)
+            result.seconds += time.perf_counter() - started
+            images = None
+            if not _put(results, result, stop):
+                return
+
+    def run(self, files):
+        """流水执行, 按输入顺序逐个产生 BatchResult; 提前结束迭代时停止各阶段"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stop = threading.Event()
+        decoded = queue.Queue(self.queue_size)
+        encoded = queue.Queue(self.queue_size)
+        results = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self.decode, args=(files, decoded, stop), daemon=True),
+            threading.Thread(target=self.compute, args=(decoded, encoded, stop), daemon=True),
+            threading.Thread(target=self.encode, args=(encoded, results, stop), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                result = _get(results, stop)
+                if result is _DONE:
+                    return
+                yield result
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+def iter_batch(scene_path, patterns, output_dir, workers=1, fuse=True, ext=".png", queue_size=QUEUE_SIZE):
+    """逐个产生每个输入文件的 BatchResult"""
+    runner = BatchRunner(scene_path, output_dir, workers, fuse, ext, queue_size)
+    yield from runner.run(expand_inputs(patterns))
+
+
+def run_batch(scene_path, patterns, output_dir, workers=1, fuse=True, ext=".png", queue_size=QUEUE_SIZE):
+    """批处理并在输出目录写入 batch_report.json, 返回全部 BatchResult"""
+    results = []
+    for result in iter_batch(scene_path, patterns, output_dir, workers, fuse, ext, queue_size):
+        if not result.ok:
+            print(f"处理失败 {result.path} ({result.stage}): {result.error}")
+        results.append(result)
+    failed = sum(not result.ok for result in results)
+    report = {
+        "scene": scene_path,
+        "total": len(results),
+        "failed": failed,
+        "files": [result.to_dict() for result in results],
+    }
+    with open(os.path.join(output_dir, "batch_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    return results
@@ -0,0 +1,60 @@
+# benchmark_bridge.py
+"""QImage/数组转换的性能测试: python benchmark_bridge.py [-n 次数]
+
+对比逐像素复制的旧实现 (cvtColor + QImage复制) 与 image_bridge 中的零复制包装,
+输出4K与8K图像每秒可以完成的转换次数。
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from PySide6.QtGui import QImage
+from image_bridge import mat_to_qimage, qimage_to_mat
+
+SIZES = {"4K": (2160, 3840), "8K": (4320, 7680)}
+
+
+def legacy_mat_to_qimage(mat):
+    """旧实现: 交换通道后复制为QImage"""
+    rgb_image = cv2.cvtColor(mat, cv2.COLOR_BGR2RGB)
+    h, w, ch = rgb_image.shape
+    return QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888).copy()
+
+
+def legacy_qimage_to_mat(qimg):
+    """旧实现: 转换为RGB888后再交换通道"""
+    qimg = qimg.convertToFormat(QImage.Format_RGB888)
+    arr = np.frombuffer(qimg.constBits(), dtype=np.uint8).reshape(qimg.height(), qimg.bytesPerLine())
+    arr = arr[:, :qimg.width() * 3].reshape(qimg.height(), qimg.width(), 3)
+    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+
+
+def rate(func, value, repeat):
+    """每秒转换次数"""
+    func(value)  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(value)
+    return repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QImage/数组转换性能测试")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="每项测试的转换次数")
+    args = parser.parse_args()
+    print(f"{'尺寸':<6}{'转换':<28}{'旧实现 (次/秒)':>16}{'零复制 (次/秒)':>16}")
+    for name, (height, width) in SIZES.items():
+        mat = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        gray = np.random.randint(0, 256, (height, width), dtype=np.uint8)
+        qimg = legacy_mat_to_qimage(mat).convertToFormat(QImage.Format_BGR888)
+        cases = [
+            ("mat_to_qimage BGR", legacy_mat_to_qimage, mat_to_qimage, mat),
+            ("mat_to_qimage 灰度", lambda m: legacy_mat_to_qimage(cv2.cvtColor(m, cv2.COLOR_GRAY2BGR)), mat_to_qimage, gray),
+            ("qimage_to_mat BGR888", legacy_qimage_to_mat, qimage_to_mat, qimg),
+        ]
+        for label, legacy, bridge, value in cases:
+            print(f"{name:<6}{label:<28}{rate(legacy, value, args.repeat):>16.1f}{rate(bridge, value, args.repeat):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmark_view.py
+"""大场景的视图刷新性能测试: python benchmark_view.py [-n 节点数] [-e 边数] [-f 帧数]
+
+生成网格排列的加法节点, 边只连接相邻的节点。对比旧配置 (全部重绘, 固定64000的场景范围,
+Qt自动的BSP深度) 与各刷新方式在自动场景范围、按图形项数确定BSP深度时的帧率:
+拖动一个节点、平移视图、整个视口重绘。无显示器时可设置 QT_QPA_PLATFORM=offscreen。
+"""
+import argparse
+import math
+import random
+import time
+from PySide6.QtCore import QPointF
+from PySide6.QtGui import QUndoStack
+from PySide6.QtWidgets import QApplication
+from scene import Scene
+from view import View, UPDATE_MODES
+from node_factory import NodeFactory
+from edge import Edge
+
+NODE_TYPE = 1101  # 加法节点: 两个输入, 一个输出
+SPACING = (200, 150)
+LEGACY_SIZE = 64000
+
+
+def build_scene(node_count, edge_count):
+    """节点排成正方形网格, 每条边连接到右侧或下一行的邻近节点"""
+    scene = Scene(None, NodeFactory())
+    columns = max(int(math.sqrt(node_count)), 2)
+    nodes = []
+    for index in range(node_count):
+        node = scene.node_factory.create_node(NODE_TYPE)
+        node.setPos((index % columns) * SPACING[0], (index // columns) * SPACING[1])
+        scene.add_node(node)
+        nodes.append(node)
+    rng = random.Random(1)
+    free = sum(len(node.input_sockets) for node in nodes[1:])
+    for _ in range(min(edge_count, free)):
+        while True:
+            start = rng.randrange(node_count - 1)
+            end = min(node_count - 1, start + rng.choice((1, 2, columns - 1, columns, columns + 1)))
+            socket = nodes[end].input_sockets[rng.randrange(len(nodes[end].input_sockets))]
+            if not socket.edges:
+                break
+        scene.add_edge(Edge(nodes[start].output_sockets[0], socket))
+    return scene, nodes
+
+
+def configure(scene, view, mode, legacy):
+    view.set_update_mode(mode)
+    if legacy:
+        scene.set_graphics_scene(LEGACY_SIZE, LEGACY_SIZE)
+        scene.setBspTreeDepth(0)
+    else:
+        scene.auto_scene_rect = True
+        scene.bsp_depth = 0
+        scene.fit_scene_rect()
+
+
+def measure(app, view, node, frames):
+    """返回 (拖动, 平移, 重绘) 的帧率"""
+    view.centerOn(node)
+    app.processEvents()
+    rates = []
+    position = node.pos()
+    start = time.perf_counter()
+    for frame in range(frames):
+        node.setPos(position + QPointF(frame % 20, frame % 7))
+        app.processEvents()
+    rates.append(frames / (time.perf_counter() - start))
+    node.setPos(position)
+    bar = view.horizontalScrollBar()
+    value = bar.value()
+    start = time.perf_counter()
+    for frame in range(frames):
+        bar.setValue(value + (frame % 40) * 4)
+        app.processEvents()
+    rates.append(frames / (time.perf_counter() - start))
+    bar.setValue(value)
+    start = time.perf_counter()
+    for frame in range(frames):
+        view.viewport().update()
+        app.processEvents()
+    rates.append(frames / (time.perf_counter() - start))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大场景视图刷新性能测试")
+    parser.add_argument("-n", "--nodes", type=int, default=10000, help="节点数")
+    parser.add_argument("-e", "--edges", type=int, default=15000, help="边数")
+    parser.add_argument("-f", "--frames", type=int, default=200, help="每项测试的帧数")
+    args = parser.parse_args()
+    app = QApplication.instance() or QApplication([])
+    start = time.perf_counter()
+    scene, nodes = build_scene(args.nodes, args.edges)
+    print(f"生成 {len(scene.nodes)} 个节点, {len(scene.edges)} 条边, {scene.item_count} 个图形项, 用时 {time.perf_counter() - start:.1f} 秒")
+    view = View(scene, QUndoStack())
+    view.resize(1600, 900)
+    view.show()
+    node = nodes[len(nodes) // 2]
+    cases = [("旧配置 (全部重绘, 固定范围)", "full", True)]
+    cases += [(label, name, False) for name, (label, _) in UPDATE_MODES.items()]
+    print(f"{'配置':<28}{'BSP深度':>8}{'拖动 (帧/秒)':>14}{'平移 (帧/秒)':>14}{'重绘 (帧/秒)':>14}")
+    for label, mode, legacy in cases:
+        configure(scene, view, mode, legacy)
+        drag, pan, repaint = measure(app, view, node, args.frames)
+        depth = "自动" if legacy else scene.bsp_depth
+        print(f"{label:<28}{depth:>8}{drag:>14.1f}{pan:>14.1f}{repaint:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,10 @@ from PySide6.QtGui import QPainter
 from PySide6.QtCore import QTimer,QEvent, QPoint,QPropertyAnimation
 from PySide6.QtGui import QRegularExpressionValidator, QPixmap, QImage, QCursor, QAction
 from PySide6.QtCore import QRegularExpression,QPointF, Qt
+import numpy as np
 from theme import StyleSheets
+from kernels import load_image
+from image_bridge import mat_to_qimage
 class Box():
     def __init__(self, socket):
         super().__init__()
@@ -20,7 +23,7 @@ class Box():
         
     def initUI(self):
 
-        self.proxy = QGraphicsProxyWidget(self.socket.node)
+        self.proxy = QGraphicsProxyWidget(self.socket.node.widget_layer)
         self.proxy.setWidget(self)
         self.update_position()
         self.setFixedHeight(self.height)
@@ -32,11 +35,26 @@ class Box():
         self.position_y = self.socket.position_y - self.height / 2
         self.proxy.setPos(self.position_x, self.position_y)
 
+    def dump_value(self):
+        """导出可序列化的参数值"""
+        return self.get_value()
+
+    def notify_changed(self):
+        """参数被修改, 节点需要重新执行"""
+        self.socket.node.mark_dirty()
+        scene = self.socket.node.scene()
+        if scene is not None:
+            for view in scene.views():
+                if hasattr(view, "request_preview"):
+                    view.request_preview()
+
 
 class LineEditBox(Box, QLineEdit):
     def __init__(self, socket):
         super().__init__(socket=socket)
         self.setValidator(QRegularExpressionValidator(QRegularExpression(r'^-?\d*\.?\d*(?:[eE][-+]?\d+)?$')))
+        # 只响应用户编辑, 显示结果时的setText不会触发
+        self.textEdited.connect(self.notify_changed)
 
     def update_display(self):
         if self.socket.value is not None:
@@ -54,6 +72,10 @@ class LineEditBox(Box, QLineEdit):
         except ValueError:
             return None
 
+    def load_value(self, value):
+        self.setText(str(value) if value is not None else "")
+        self.notify_changed()
+
 
 # 添加一个图片组件
 class ImageBox(Box, QLabel):
@@ -62,6 +84,8 @@ class ImageBox(Box, QLabel):
         self.height = self.socket.node.width - self.socket.node.title_height
         self.value = None
         self.pixmap = None
+        self.file_path = None  # 图片来源路径, 用于序列化
+        self.displayed = None  # 当前pixmap对应的数组, 未改变时不重新转换
 
 
     def show_context_menu(self, position):
@@ -118,32 +142,56 @@ class ImageBox(Box, QLabel):
             "图片文件 (*.jpg *.png *.bmp)"
         )
         if file_name:
-            self.value = QImage(file_name)
-            self.socket.value = self.value
-            self.update_display()
+            self.load_value(file_name)
+
+    def dump_value(self):
+        return self.file_path
+
+    def load_value(self, file_name):
+        """从文件加载图片"""
+        if not file_name:
+            return
+        try:
+            image = load_image(file_name)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
+        self.file_path = file_name
+        self.value = image
+        self.socket.value = self.value
+        self.update_display()
+        self.notify_changed()
 
     def update_display(self):
-        if self.socket.value is not None and isinstance(self.socket.value, QImage):
-            self.pixmap = QPixmap.fromImage(self.socket.value)
+        image = self.socket.value
+        if isinstance(image, np.ndarray):
+            if image is self.displayed:
+                return
+            # 只在显示时转换为QImage
+            self.pixmap = QPixmap.fromImage(mat_to_qimage(image))
+            self.displayed = image
             self.setPixmap(self.pixmap)
             self.setFixedWidth(self.width)
             self.setScaledContents(True)
             # 按照图片的高宽比来重新更新self.height
-            self.height = self.width * self.socket.value.height() / self.socket.value.width()
+            self.height = self.width * image.shape[0] / image.shape[1]
             self.setFixedHeight(self.height)
             
         else:
+            self.displayed = None
             self.setText("点击选择图片")
             self.setStyleSheet(StyleSheets.image_label_placeholder())
             self.setAlignment(Qt.AlignCenter)
 
     def get_value(self):
-        return self.value if isinstance(self.value, QImage) else None
+        return self.value if isinstance(self.value, np.ndarray) else None
         
     def delete_image(self):
         self.value = None
+        self.file_path = None
         self.socket.value = None
         self.pixmap = None
+        self.notify_changed()
         # 设置标志位避免重复触发
         self.blockSignals(True)
         self.update_display()
@@ -152,7 +200,7 @@ class ImageBox(Box, QLabel):
         
     def view_large_image(self):
         """优化版大图查看器：支持平滑缩放和抗锯齿渲染"""
-        if not isinstance(self.socket.value, QImage):
+        if not isinstance(self.socket.value, np.ndarray):
             print("错误：没有可用的图片数据")
             return
 
@@ -163,7 +211,7 @@ class ImageBox(Box, QLabel):
         # 使用 QGraphicsView 实现高级渲染
         view = QGraphicsView()
         scene = QGraphicsScene()
-        pixmap = QPixmap.fromImage(self.socket.value)
+        pixmap = QPixmap.fromImage(mat_to_qimage(self.socket.value))
         pixmap_item = scene.addPixmap(pixmap)
         
         # 配置渲染参数
@@ -188,7 +236,7 @@ class ImageBox(Box, QLabel):
 
     def save_image(self):
         """保存当前显示的图片到文件"""
-        if not isinstance(self.socket.value, QImage):
+        if not isinstance(self.socket.value, np.ndarray):
             print("错误：没有可用的图片数据")
             return False
             
@@ -217,7 +265,7 @@ class ImageBox(Box, QLabel):
             format = "BMP"
             
         # 保存图片
-        if self.socket.value.save(file_name, format):
+        if mat_to_qimage(self.socket.value).save(file_name, format):
             print(f"图片已成功保存到：{file_name}")
             return True
         else:
@@ -251,5 +299,9 @@ class SliderBox(Box, QSlider):
     def get_value(self):
         return super().value()
 
+    def load_value(self, value):
+        self.setValue(int(value or 0))
+
     def on_value_changed(self, value):
         self.socket.value = value
+        self.notify_changed()
@@ -0,0 +1,88 @@
+# buffer_pool.py
+"""中间图像的缓冲区池
+
+内核的输出数组 (cv2 的 dst) 按 (形状, 数据类型) 从池中取得。池持有分配过的缓冲区,
+除池以外没有任何引用时即视为已归还: 插座、结果缓存、视图 (其base即缓冲区) 与显示用的QImage
+都持有引用, 因此仍在使用的缓冲区不会被复用。同尺寸的图像重复执行时不再分配内存。
+池持有的总字节数超出预算时释放最久未使用的空闲缓冲区。
+"""
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_BUDGET = 256 * 1024 * 1024  # 默认256MB
+
+
+def _refcount(arrays, index):
+    return sys.getrefcount(arrays[index])
+
+
+# 只被池的列表引用时的引用计数 (不同Python版本的计数方式不同, 导入时测定)
+_FREE_REFCOUNT = _refcount([np.empty(1)], 0)
+
+
+class BufferPool:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET):
+        self.budget_bytes = budget_bytes  # 为0时不使用池, 内核自行分配
+        self.buffers = OrderedDict()  # (形状, 数据类型) -> [数组], 最近使用的在末尾
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def take(self, shape, dtype=np.uint8):
+        """取得一个未被引用的缓冲区 (内容未初始化), 不使用池时返回None"""
+        if self.budget_bytes <= 0:
+            return None
+        shape = tuple(shape)
+        key = (shape, np.dtype(dtype).str)
+        with self.lock:
+            arrays = self.buffers.get(key)
+            if arrays is not None:
+                for index in range(len(arrays)):
+                    if _refcount(arrays, index) <= _FREE_REFCOUNT:
+                        self.buffers.move_to_end(key)
+                        self.hits += 1
+                        return arrays[index]
+            self.misses += 1
+            array = np.empty(shape, dtype)
+            if array.nbytes > self.budget_bytes:
+                return array  # 超出预算的缓冲区不放入池中
+            self.buffers.setdefault(key, []).append(array)
+            self.buffers.move_to_end(key)
+            self.size += array.nbytes
+            if self.size > self.budget_bytes:
+                self.trim()
+            return array
+
+    def trim(self):
+        """释放最久未使用的空闲缓冲区, 直到不超出预算"""
+        for key in list(self.buffers):
+            arrays = self.buffers[key]
+            index = 0
+            while index < len(arrays) and self.size > self.budget_bytes:
+                if _refcount(arrays, index) <= _FREE_REFCOUNT:
+                    self.size -= arrays.pop(index).nbytes
+                else:
+                    index += 1
+            if not arrays:
+                del self.buffers[key]
+            if self.size <= self.budget_bytes:
+                return
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "buffers": sum(len(arrays) for arrays in self.buffers.values()),
+            "bytes": self.size,
+        }
+
+
+BUFFER_POOL = BufferPool()  # 进程内共享, 多进程后端的每个工作进程各有一个
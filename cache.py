@@ -0,0 +1,86 @@
+# cache.py
+"""节点输出结果缓存
+
+键为 (节点类型, 参数指纹, 上游输出的键), 上游输出的键在产生时即确定,
+因此查询缓存不需要重新哈希整幅图像。按图像字节数计算内存预算, 超出时淘汰最久未使用的条目。
+"""
+import hashlib
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_BUDGET = 512 * 1024 * 1024  # 默认512MB
+SMALL_VALUE_SIZE = 64  # 数值等小对象按固定字节数计
+
+_array_digests = {}  # id(array) -> (weakref, digest), 同一数组只哈希一次
+
+
+def value_nbytes(value):
+    """估算值占用的字节数"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, "sizeInBytes"):  # QImage
+        return value.sizeInBytes()
+    return SMALL_VALUE_SIZE
+
+
+def fingerprint(value):
+    """参数值的指纹, 无法识别的类型返回None表示不可缓存"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return ("v", value)
+    if isinstance(value, np.ndarray):
+        entry = _array_digests.get(id(value))
+        if entry is not None and entry[0]() is value:
+            return entry[1]
+        data = np.ascontiguousarray(value)
+        digest = ("nd", value.shape, value.dtype.str, hashlib.blake2b(data.data, digest_size=16).hexdigest())
+        _array_digests[id(value)] = (weakref.ref(value, lambda ref, key=id(value): _array_digests.pop(key, None)), digest)
+        return digest
+    if hasattr(value, "cacheKey"):  # QImage, 内容改变时cacheKey随之改变
+        return ("qimage", value.cacheKey())
+    return None
+
+
+class ResultCache:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # key -> (outputs, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, outputs):
+        size = sum(value_nbytes(value) for value in outputs)
+        if size > self.budget_bytes:
+            return  # 单个结果超出预算, 不缓存
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (list(outputs), size)
+        self.size += size
+        while self.size > self.budget_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.size,
+        }
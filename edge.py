@@ -2,13 +2,23 @@
 import math
 from PySide6.QtWidgets import QGraphicsPathItem, QGraphicsItem
 from PySide6.QtGui import QPainterPath, QPen, QPainter, QColor, QPainterPathStroker
-from PySide6.QtCore import Qt, QPointF
+from PySide6.QtCore import Qt, QPointF, QLineF, QRectF
+from node import LOD_FULL, LOD_MINIMAL
 
 EDGE_CP_ROUNDNESS = 0.5  # 控制点曲率系数
+EDGE_HIT_WIDTH = 10  # 点击区域的宽度
+EDGE_PADDING = 5  # 包围矩形的留白, 便于点击
+
+_STROKER = QPainterPathStroker()
+_STROKER.setWidth(EDGE_HIT_WIDTH)
 
 class Edge(QGraphicsPathItem):
     def __init__(self, start_socket, end_socket):
         super().__init__()
+        # 路径、包围矩形与点击区域在update_path中更新, 点击区域在第一次命中测试时才计算
+        self._path = QPainterPath()
+        self._bounding_rect = QRectF()
+        self._shape = None
         self.start_socket = start_socket
         self.end_socket = end_socket
         # 初始化input_socket和output_socket为None
@@ -21,6 +31,8 @@ class Edge(QGraphicsPathItem):
         self.initEdge()  # 初始化插座关系
         self.pen = QPen(self.start_socket.background_color, 2)
         self.pen_selected = QPen(QColor("#F2E383"), 2)
+        self.line = QLineF()  # 两端插座之间的直线, 缩小时代替曲线绘制
+        self.lod = LOD_FULL
         self.setPen(self.pen)
         self.setZValue(-1)  
         self.update_path()  # 立即更新路径
@@ -41,9 +53,9 @@ class Edge(QGraphicsPathItem):
 
     # 构建函数用于传递参数
     def transfer_value(self):
+        # 边本身不保存值, 否则中间结果在输入插座释放后仍被边引用
         if self.output_socket is not None:
-            self.value = self.output_socket.value
-            self.input_socket.value = self.value
+            self.input_socket.value = self.output_socket.value
 
 
     def update_path(self, mouse_pos=None):
@@ -76,25 +88,34 @@ class Edge(QGraphicsPathItem):
                     )
                 ) * EDGE_CP_ROUNDNESS
 
+        self.line = QLineF(start_pos, end_pos)
         path = QPainterPath(start_pos)
         path.cubicTo(
             start_pos.x() + ctrl1_x, start_pos.y() + ctrl1_y,
             end_pos.x() + ctrl2_x, end_pos.y() + ctrl2_y,
             end_pos.x(), end_pos.y()
         )
+        # setPath中的prepareGeometryChange要在包围矩形改变之前调用
         self.setPath(path)
+        self._path = path
+        self._bounding_rect = path.boundingRect().adjusted(-EDGE_PADDING, -EDGE_PADDING, EDGE_PADDING, EDGE_PADDING)
+        self._shape = None
         self.update()
 
 
     def boundingRect(self):
-        return self.path().boundingRect().adjusted(-5, -5, 5, 5)  # 添加一些padding以便于点击
+        return self._bounding_rect
 
     def shape(self):
-        path = QPainterPathStroker()
-        path.setWidth(10)  # 设置点击区域的宽度
-        return path.createStroke(self.path())
+        if self._shape is None:
+            self._shape = _STROKER.createStroke(self._path)
+        return self._shape
 
     def paint(self, painter, option, widget=None):
-        painter.setRenderHint(QPainter.Antialiasing)
         painter.setPen(self.pen_selected if self.isSelected() else self.pen)
-        painter.drawPath(self.path())
+        if self.lod == LOD_MINIMAL:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.drawLine(self.line)
+            return
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.drawPath(self._path)
@@ -0,0 +1,236 @@
+# fusion.py
+"""相邻节点的融合与感兴趣区域 (ROI) 的传递
+
+亮度、对比度等逐像素节点对每个取值的映射都相同, 可以表示为256项的查找表。
+连续的逐像素节点只组合查找表, 由链上最后一个节点调用一次 cv2.LUT,
+查找表直接由内核作用于0到255得到, 因此结果与逐个执行完全一致。
+
+旋转、缩放、翻转、裁剪都是仿射变换, 连续的几何节点只组合矩阵,
+由链上最后一个节点调用一次 cv2.warpAffine, 输出尺寸即最后的裁剪区域,
+只重采样一次, 不产生中间图像。
+
+灰度、RGB分离、叠加等声明了halo的节点不能组合, 但输出的每个像素只取决于输入的邻域,
+延迟时只记录输入, 下游取窗口时才在扩展halo后的窗口上执行内核。
+
+延迟的结果通过 region(x, y, width, height) 按区域计算: 下游只取出需要的窗口,
+逐像素节点把窗口原样交给上游, 几何节点把窗口反向映射为上游的区域 (留出插值所需的边距),
+邻域节点把窗口扩展halo后交给上游, 最终在源图像上以零复制的切片取出。
+因此裁剪之前的整条链只处理裁剪窗口对应的像素。
+"""
+import math
+import cv2
+import numpy as np
+from kernels import NODE_SPECS, get_kernel, run_kernel, output_buffer, rotate_affine
+
+_RAMP = np.arange(256, dtype=np.uint8).reshape(1, 256)
+WARP_MARGIN = 2  # 双线性插值在源图像上需要的额外像素
+
+LUT = "lut"
+WARP = "warp"
+REGION = "region"
+
+
+def _translation(x, y):
+    return np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+
+
+def image_size(image):
+    """图像或延迟结果的尺寸 (宽, 高)"""
+    if is_deferred(image):
+        return image.size
+    return image.shape[1], image.shape[0]
+
+
+def image_region(image, x, y, width, height):
+    """图像中的一个窗口: 数组直接切片 (不复制), 延迟结果只计算该窗口"""
+    if is_deferred(image):
+        return image.region(x, y, width, height)
+    return image[y:y + height, x:x + width]
+
+
+def _empty(image, width, height):
+    """空窗口, 通道数与数据类型取自图像左上角的一个像素 (邻域节点可能改变通道数)"""
+    sample = image_region(image, 0, 0, 1, 1)
+    return np.empty((max(height, 0), max(width, 0)) + sample.shape[2:], dtype=sample.dtype)
+
+
+class DeferredLUT:
+    """尚未应用的查找表, 只在融合链内部传递"""
+    def __init__(self, image, lut):
+        self.image = image  # 链头的输入图像 (数组或延迟结果)
+        self.lut = lut
+
+    @property
+    def size(self):
+        return image_size(self.image)
+
+    def region(self, x, y, width, height):
+        if width <= 0 or height <= 0:
+            return _empty(self.image, width, height)
+        source = image_region(self.image, x, y, width, height)
+        return cv2.LUT(source, self.lut, dst=output_buffer(source.shape, self.lut.dtype))
+
+    def materialize(self):
+        return self.region(0, 0, *self.size)
+
+
+class DeferredWarp:
+    """尚未应用的仿射变换, 只在融合链内部传递"""
+    def __init__(self, image, matrix, size, constant_border):
+        self.image = image  # 链头的输入图像 (数组或延迟结果)
+        self.matrix = matrix  # 3x3, 链头图像坐标 -> 输出坐标
+        self.size = size  # 输出尺寸 (宽, 高)
+        self.constant_border = constant_border  # 旋转露出的区域填充黑色, 否则延伸边缘像素 (同resize)
+
+    def region(self, x, y, width, height):
+        if width <= 0 or height <= 0:
+            return _empty(self.image, width, height)
+        # 以窗口左上角为原点的矩阵
+        matrix = _translation(-x, -y) @ self.matrix
+        sliced = self.slice(matrix, width, height)
+        if sliced is not None:
+            return sliced
+        # 窗口反向映射到源图像, 只读取覆盖它的区域
+        source_width, source_height = image_size(self.image)
+        corners = np.array([[0, 0, 1], [width, 0, 1], [0, height, 1], [width, height, 1]], dtype=np.float64)
+        mapped = corners @ np.linalg.inv(matrix).T
+        # 窗口在图像之外时保留最近的一行或一列, 边界填充的结果不变
+        x0 = min(max(0, math.floor(mapped[:, 0].min()) - WARP_MARGIN), source_width - 1)
+        y0 = min(max(0, math.floor(mapped[:, 1].min()) - WARP_MARGIN), source_height - 1)
+        x1 = max(min(source_width, math.ceil(mapped[:, 0].max()) + WARP_MARGIN), x0 + 1)
+        y1 = max(min(source_height, math.ceil(mapped[:, 1].max()) + WARP_MARGIN), y0 + 1)
+        source = image_region(self.image, x0, y0, x1 - x0, y1 - y0)
+        matrix = matrix @ _translation(x0, y0)
+        border = cv2.BORDER_CONSTANT if self.constant_border else cv2.BORDER_REPLICATE
+        dst = output_buffer((height, width) + source.shape[2:], source.dtype)
+        return cv2.warpAffine(source, matrix[:2], (width, height), dst=dst, flags=cv2.INTER_LINEAR, borderMode=border)
+
+    def slice(self, matrix, width, height):
+        """只由翻转和裁剪组成时不需要插值, 直接切片 (有翻转时再cv2.flip), 不在图像范围内时返回None"""
+        matrix = matrix[:2]
+        rounded = np.round(matrix)
+        if not np.allclose(matrix, rounded, atol=1e-9):
+            return None
+        (a, b, tx), (c, d, ty) = rounded.astype(int)
+        if b != 0 or c != 0 or abs(a) != 1 or abs(d) != 1:
+            return None
+        source_width, source_height = image_size(self.image)
+        # 输出坐标 x' = a * x + tx, 即 x = a * (x' - tx); 求出对应的源区域
+        x0 = -tx if a > 0 else tx - (width - 1)
+        y0 = -ty if d > 0 else ty - (height - 1)
+        if x0 < 0 or y0 < 0 or x0 + width > source_width or y0 + height > source_height:
+            return None
+        view = image_region(self.image, x0, y0, width, height)
+        if a > 0 and d > 0:
+            return view  # 只有裁剪时与Crop节点一样返回视图
+        return cv2.flip(view, 1 if d > 0 else 0 if a > 0 else -1, dst=output_buffer(view.shape, view.dtype))
+
+    def materialize(self):
+        return self.region(0, 0, *self.size)
+
+
+class DeferredRegion:
+    """尚未执行的邻域节点的一个输出, 只在融合链内部传递
+
+    窗口扩展halo后在各图像输入 (尺寸相同) 上切片, 只对该区域执行内核, 再取出窗口。
+    """
+    def __init__(self, node_type, inputs, index):
+        self.node_type = node_type
+        self.inputs = inputs  # 图像输入为数组或延迟结果
+        self.index = index  # 对应的输出插座
+        self.images = [i for i, config in enumerate(NODE_SPECS[node_type]["input_sockets"]) if config.get("datatype") == 1]
+
+    @property
+    def size(self):
+        return image_size(self.inputs[0])
+
+    def region(self, x, y, width, height):
+        if width <= 0 or height <= 0:
+            return _empty(self, width, height)
+        source_width, source_height = self.size
+        halo = NODE_SPECS[self.node_type]["halo"]
+        x0, y0 = max(0, x - halo), max(0, y - halo)
+        x1, y1 = min(source_width, x + width + halo), min(source_height, y + height + halo)
+        inputs = list(self.inputs)
+        for i in self.images:
+            inputs[i] = image_region(inputs[i], x0, y0, x1 - x0, y1 - y0)
+        output = run_kernel(self.node_type, inputs, {self.index})[self.index]
+        return output[y - y0:y - y0 + height, x - x0:x - x0 + width]
+
+    def materialize(self):
+        return self.region(0, 0, *self.size)
+
+
+def _run_region(node_type, inputs, deferred, demand):
+    """每个输出各自延迟, 下游只取用的输出才会计算; 不延迟或各图像输入尺寸不同 (叠加时内核会缩放) 时直接执行"""
+    images = [i for i, config in enumerate(NODE_SPECS[node_type]["input_sockets"]) if config.get("datatype") == 1]
+    if any(inputs[i] is None for i in images):
+        return run_kernel(node_type, inputs, demand)  # 缺少输入时内核直接返回None
+    if deferred and len({image_size(inputs[i]) for i in images}) == 1:
+        count = len(NODE_SPECS[node_type]["output_sockets"])
+        return tuple(DeferredRegion(node_type, inputs, index) for index in range(count))
+    inputs = list(inputs)
+    for i in images:
+        if is_deferred(inputs[i]):
+            inputs[i] = inputs[i].materialize()
+    return run_kernel(node_type, inputs, demand)
+
+
+def fusion_group(node_type):
+    """节点所属的融合类别, 不能融合时返回None"""
+    spec = NODE_SPECS.get(node_type)
+    if spec is None:
+        return None
+    if spec["pointwise"]:
+        return LUT
+    if spec["affine"] is not None:
+        return WARP
+    if spec["halo"] is not None:
+        return REGION
+    return None
+
+
+def is_deferred(value):
+    return isinstance(value, (DeferredLUT, DeferredWarp, DeferredRegion))
+
+
+def node_lut(node_type, params):
+    """节点在给定参数下的查找表"""
+    return get_kernel(node_type)(_RAMP, *params)[0].reshape(256)
+
+
+def _run_lut(node_type, image, params):
+    lut = node_lut(node_type, params)
+    if isinstance(image, DeferredLUT):
+        # 先应用上游的表, 再应用本节点的表
+        image, lut = image.image, lut[image.lut]
+    return DeferredLUT(image, lut)
+
+
+def _run_warp(node_type, image, params):
+    if isinstance(image, DeferredWarp):
+        base, matrix, size, constant_border = image.image, image.matrix, image.size, image.constant_border
+    else:
+        base, matrix, size, constant_border = image, np.eye(3), image_size(image), False
+    affine = NODE_SPECS[node_type]["affine"]
+    step, size = affine(size, *params)
+    matrix = np.vstack([step, [0, 0, 1]]) @ matrix
+    # 旋转以外的变换不会露出图像外的区域
+    constant_border = constant_border or affine is rotate_affine
+    return DeferredWarp(base, matrix, size, constant_border)
+
+
+def run_fused(node_type, inputs, deferred=False, demand=None):
+    """执行可融合的节点; deferred为True时返回延迟的结果留给下游继续组合, demand同run_kernel"""
+    image, params = inputs[0], inputs[1:]
+    if image is None:
+        return (None,) * len(NODE_SPECS[node_type]["output_sockets"])
+    if not deferred and not is_deferred(image):
+        return run_kernel(node_type, inputs, demand)  # 单个节点直接执行
+    if fusion_group(node_type) == REGION:
+        return _run_region(node_type, inputs, deferred, demand)
+    if fusion_group(node_type) == LUT:
+        result = _run_lut(node_type, image, params)
+    else:
+        result = _run_warp(node_type, image, params)
+    return (result if deferred else result.materialize(),)
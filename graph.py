@@ -1,13 +1,121 @@
-from node import Node
+import threading
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from cache import fingerprint
+from kernels import NODE_SPECS, proxy_image, proxy_scale
+from fusion import fusion_group, is_deferred, run_fused
+
+
+class ExecutionCancelled(Exception):
+    """执行被取消"""
+
+
+def downstream_nodes(node):
+    """直接下游节点"""
+    for socket in node.output_sockets:
+        for edge in socket.edges:
+            if edge.input_socket is not None:
+                yield edge.input_socket.node
+
+
+def upstream_socket(socket):
+    """输入插座所连接的上游输出插座"""
+    for edge in socket.edges:
+        if edge.output_socket is not None:
+            return edge.output_socket
+    return None
+
+
+def upstream_nodes(node):
+    """直接上游节点"""
+    for socket in node.input_sockets:
+        upstream = upstream_socket(socket)
+        if upstream is not None:
+            yield upstream.node
+
+
+def is_output_node(node):
+    """没有输出插座的节点即输出节点"""
+    return not node.output_sockets
+
+
+def is_display_node(node):
+    """有输入且在输出显示框中展示结果的节点, 如图像尺寸; 输入节点的显示框用于编辑, 不算在内"""
+    return bool(node.input_sockets) and any(socket.box_type == 1 for socket in node.output_sockets)
+
+
+def upstream_cone(targets):
+    """目标节点及其全部上游节点"""
+    cone = set()
+    stack = list(targets)
+    while stack:
+        node = stack.pop()
+        if node in cone:
+            continue
+        cone.add(node)
+        stack.extend(upstream_nodes(node))
+    return cone
+
+
+# 界面线程标记脏节点与执行线程清除脏标记互斥
+DIRTY_LOCK = threading.Lock()
+
+
+def mark_dirty(node):
+    """标记节点需要重新执行, 并向下游传播
+
+    已经是脏的节点其下游必然也是脏的, 因此遇到时即可停止。每个经过的节点的修改代数加一,
+    正在执行的节点据此得知执行期间被修改过, 完成后保持脏状态。
+    """
+    with DIRTY_LOCK:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            node.edit_generation = getattr(node, "edit_generation", 0) + 1
+            if getattr(node, "dirty", False):
+                continue
+            node.dirty = True
+            stack.extend(downstream_nodes(node))
+
 
 class Graph():
-    def __init__(self, scene):
+    def __init__(
+        self, scene, cache=None, workers=1, processes=None, demand_driven=False, release_intermediates=False,
+        fuse_nodes=True,
+    ):
         self.scene = scene
         self.nodes = scene.nodes
         self.edges = scene.edges
+        self.cache = cache  # ResultCache, 为None时不缓存
+        self.workers = workers  # 大于1时并行执行相互独立的分支
+        self.processes = processes  # ProcessBackend, 进程安全的节点交给工作进程执行
+        self.demand_driven = demand_driven  # 只执行输出节点所需的上游节点
+        self.output_demand = {}  # 本次执行中 节点 -> 需要计算的输出插座序号
+        # 下游全部执行完后释放中间结果, 峰值内存取决于图的宽度而不是长度
+        self.release_intermediates = release_intermediates
+        self.pending_consumers = {}  # 输出插座 -> 本次执行中尚未执行的下游插座数
+        self.generations = {}  # 节点 -> 开始执行时的修改代数
+        self.targets = set()
+        self.preview = None  # 本次执行的预览宽度, None表示全分辨率
+        self.proxy_scales = {}  # 预览时 图像输出插座 -> 全分辨率相对代理图像的 (宽度, 高度) 比例
+        # 连续的逐像素节点组合为一次查找表运算, 连续的几何节点组合为一次warpAffine, 调试时可以关闭
+        self.fuse_nodes = fuse_nodes
+        self.deferred = set()  # 本次执行中输出留给下游继续组合的节点
+        self.cancel_event = threading.Event()
+        # 进度回调, 在执行图的线程中调用
+        self.on_node_started = None  # (node)
+        self.on_node_finished = None  # (node)
+        self.on_node_failed = None  # (node, error)
+        # 在界面线程中执行函数并返回结果, 由GraphRunner设置; 为None时在当前线程执行
+        self.main_thread_call = None
+        self.params = None  # 本次执行使用的 插座 -> 参数 (界面线程中记录), 为None时直接读取输入框
 
     def get_execution_order(self):
+        # 场景增量维护了拓扑序时直接使用
+        topology = getattr(self.scene, "topology", None)
+        if topology is not None:
+            return topology.order()
         # 构建邻接表和入度表
         adj_list = {node: [] for node in self.nodes}
         in_degree = {node: 0 for node in self.nodes}
@@ -51,24 +159,405 @@ class Graph():
             raise Exception("检测到循环依赖，无法确定执行顺序")
         return execution_order
     
-    # 执行
-    def execute(self):
+    # 执行: 只运行脏节点, 其余节点保留上次的输出
+    def execute(self, targets=None, preview=None, params=None):
+        """targets: 只计算这些节点及其上游; 为None且按需执行时以全部输出节点为目标
+
+        preview: 预览宽度 (像素)。源节点的图像换成金字塔中接近该宽度的代理图像,
+        执行过的节点仍保持脏状态, 之后的全分辨率执行会重新计算 (有缓存时直接命中)。
+        params: snapshot_params() 的结果; 在其他线程中执行时由界面线程事先记录, 不在执行中访问控件。
+        """
+        self.preview = preview
+        self.params = params
+        self.proxy_scales = {}
         try:
-            execution_order = self.get_execution_order()
-            for node in execution_order:
-                try:
-                    node.run()
-                    # 传递数据到下游节点
-                    for socket in node.output_sockets:
-                        for edge in socket.edges:
-                            edge.transfer_value()
-                except Exception as e:
-                    print(f"节点 {node} 执行失败: {str(e)}")
-                    raise
+            if targets is None and self.demand_driven:
+                # 结果显示在节点上的节点同样是目标, 不必连到输出节点
+                targets = [node for node in self.nodes if is_output_node(node) or is_display_node(node)]
+            # 不通向目标的分支保持脏状态, 需要时再计算
+            needed = upstream_cone(targets) if targets is not None else set(self.nodes)
+            self.output_demand = {
+                node: self.demanded_outputs(node, needed, targets) for node in needed
+            }
+            if preview is None:
+                execution_order = self.nodes_to_run(needed, targets)
+            else:
+                # 上游保留的是全分辨率的输出, 预览时整条链都以代理图像重新计算
+                execution_order = [node for node in self.get_execution_order() if node in needed]
+            self.targets = set(targets) if targets is not None else set()
+            self.deferred = self.plan_fusion(execution_order) if self.fuse_nodes else set()
+            self.pending_consumers = {}
+            self.generations = {}
+            if self.release_intermediates:
+                self.count_consumers(execution_order)
+            if self.workers > 1:
+                self.execute_parallel(execution_order)
+            else:
+                for node in execution_order:
+                    self.check_cancelled()
+                    self.run_node(node)
+        except ExecutionCancelled:
+            print("图执行已取消")
+            raise
         except Exception as e:
             print(f"图执行失败: {str(e)}")
             raise
+        finally:
+            # 取消在开始之前发出时同样生效, 结束后清除, 不影响下次执行
+            self.cancel_event.clear()
+
+    def snapshot_params(self):
+        """记录全部输入框的参数, 须在界面线程中调用"""
+        return {
+            socket: socket.param
+            for node in self.nodes
+            for socket in node.input_sockets + node.output_sockets
+            if socket.box_type != 0
+        }
+
+    def param(self, socket):
+        if self.params is not None and socket in self.params:
+            return self.params[socket]
+        return socket.param
+
+    def node_inputs(self, node):
+        """计算内核的输入; 有记录的参数时未连接的插座取记录的值"""
+        if self.params is None:
+            return node.get_inputs()
+        if node.input_sockets:
+            return [socket.value if socket.has_edge() else self.param(socket) for socket in node.input_sockets]
+        return [self.param(socket) for socket in node.output_sockets]
+
+    def demanded_outputs(self, node, needed, targets):
+        """需要计算的输出插座: 连向需要执行的节点, 或带有显示框, 目标节点的全部输出"""
+        if targets is not None and node in targets:
+            return frozenset(socket.index for socket in node.output_sockets)
+        return frozenset(
+            socket.index for socket in node.output_sockets
+            if socket.box_type != 0 or any(
+                edge.input_socket is not None and edge.input_socket.node in needed
+                for edge in socket.edges
+            )
+        )
+
+    def nodes_to_run(self, needed, targets):
+        """需要执行的节点: 脏节点, 以及缺少的输出将被本次执行的下游 (或作为目标) 使用的节点"""
+        order = [node for node in self.get_execution_order() if node in needed]
+        scheduled = set()
+        for node in reversed(order):
+            if node.dirty:
+                scheduled.add(node)
+                continue
+            missing = self.output_demand[node] & node.missing_outputs
+            if not missing:
+                continue
+            if targets is not None and node in targets:
+                scheduled.add(node)
+                continue
+            for socket in node.output_sockets:
+                if socket.index in missing and any(
+                    edge.input_socket is not None and edge.input_socket.node in scheduled
+                    for edge in socket.edges
+                ):
+                    scheduled.add(node)
+                    break
+        return [node for node in order if node in scheduled]
+
+    def plan_fusion(self, execution_order):
+        """找出可以延迟输出的节点: 每个连接的输出只连到本次执行的一个可融合节点的第一个图像输入
+
+        同类节点组合查找表或矩阵; 不同类的节点嵌套延迟结果, 下游裁剪时只计算需要的区域。
+        多输出的邻域节点 (RGB分离) 各输出分别延迟, 未连接的输出不计算。
+        """
+        running = set(execution_order)
+        deferred = set()
+        for node in execution_order:
+            if self.fusion_group(node) is None or any(self.is_pinned(socket) for socket in node.output_sockets):
+                continue
+            used = [socket for socket in node.output_sockets if socket.edges]
+            if used and all(len(socket.edges) == 1 and self.fuses_into(socket.edges[0].input_socket, running) for socket in used):
+                deferred.add(node)
+        return deferred
+
+    def fuses_into(self, consumer, running):
+        return (
+            consumer is not None and consumer.index == 0 and consumer.node in running
+            and self.fusion_group(consumer.node) is not None
+        )
+
+    def fusion_group(self, node):
+        if getattr(node, "legacy", False):
+            return None
+        return fusion_group(node.type)
+
+    def count_consumers(self, execution_order):
+        """统计每个输出插座在本次执行中还有多少下游插座要读取"""
+        for node in execution_order:
+            for socket in node.input_sockets:
+                upstream = upstream_socket(socket)
+                if upstream is not None:
+                    self.pending_consumers[upstream] = self.pending_consumers.get(upstream, 0) + 1
+
+    def is_pinned(self, socket):
+        """固定的插座、带显示框的插座、输出节点与目标节点的值不释放"""
+        node = socket.node
+        return (
+            getattr(socket, "pinned", False)
+            or socket.box_type != 0
+            or is_output_node(node)
+            or node in self.targets
+        )
+
+    def release_inputs(self, node):
+        """节点执行完成后释放输入插座上的副本, 上游输出的最后一个读取者执行完后释放该输出"""
+        for socket in node.input_sockets:
+            upstream = upstream_socket(socket)
+            if upstream is None:
+                continue
+            if not self.is_pinned(socket):
+                socket.value = None
+            count = self.pending_consumers.get(upstream)
+            if count is None:
+                continue
+            if count > 1:
+                self.pending_consumers[upstream] = count - 1
+                continue
+            del self.pending_consumers[upstream]
+            if not self.is_pinned(upstream) and upstream.value is not None:
+                # 记为缺失, 以后有下游需要时重新计算 (有缓存时直接命中)
+                upstream.value = None
+                upstream.value_key = None
+                upstream.node.missing_outputs = upstream.node.missing_outputs | {upstream.index}
+
+    def cancel(self):
+        """取消执行: 不再调度新的节点, 正在计算的节点完成后停止; 可从任意线程调用, 在执行开始前调用同样有效"""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ExecutionCancelled("执行已取消")
+
+    def execute_parallel(self, execution_order):
+        """上游全部完成的节点提交到线程池计算
+
+        读取输入与写回输出都在调用线程中进行, 同时完成的节点按执行顺序写回,
+        因此下游插座得到的结果与顺序执行一致。
+        """
+        position = {node: i for i, node in enumerate(execution_order)}
+        waiting = {}  # 节点 -> 尚未完成的上游脏节点数
+        for node in execution_order:
+            waiting[node] = len({upstream for upstream in upstream_nodes(node) if upstream in position})
+        ready = [node for node in execution_order if waiting[node] == 0]
+        running = {}  # future -> (node, key)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while ready or running:
+                    finished = []
+                    for node in ready:
+                        self.check_cancelled()
+                        key, inputs, outputs = self.prepare_node(node)
+                        if outputs is not None:
+                            finished.append((node, key, outputs))
+                        elif getattr(node, "thread_safe", True):
+                            running[pool.submit(self.compute_node, node, inputs)] = (node, key)
+                        else:
+                            finished.append((node, key, self.compute_checked(node, inputs)))
+                    ready = []
+                    if running and not finished:
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            node, key = running.pop(future)
+                            error = future.exception()
+                            if error is not None:
+                                self.node_failed(node, error)
+                                raise error
+                            finished.append((node, key, future.result()))
+                    finished.sort(key=lambda item: position[item[0]])
+                    for node, key, outputs in finished:
+                        self.commit_node(node, key, outputs)
+                        for downstream in set(downstream_nodes(node)):
+                            if downstream in waiting:
+                                waiting[downstream] -= 1
+                                if waiting[downstream] == 0:
+                                    ready.append(downstream)
+                    ready.sort(key=position.get)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+
+    def run_node(self, node):
+        """执行单个节点, 命中缓存时直接使用缓存的输出"""
+        key, inputs, outputs = self.prepare_node(node)
+        if outputs is None:
+            outputs = self.compute_checked(node, inputs)
+        self.commit_node(node, key, outputs)
+
+    def prepare_node(self, node):
+        """拉取输入并查询缓存, 返回 (缓存键, 输入, 命中的输出或None)"""
+        if self.on_node_started is not None:
+            self.on_node_started(node)
+        self.generations[node] = getattr(node, "edit_generation", 0)
+        self.pull_inputs(node)
+        key = self.node_key(node, self.output_demand.get(node)) if self.cache is not None and node.output_sockets else None
+        # 融合链内部的节点不查询缓存, 命中时链会断开, 链尾的结果与键中记录的融合方式不符
+        outputs = self.cache.get(key) if key is not None and node not in self.deferred else None
+        inputs = self.node_inputs(node) if outputs is None else None
+        if inputs is not None and self.preview is not None:
+            inputs = self.scale_pixel_inputs(node, inputs)
+        return key, inputs, outputs
+
+    def compute_node(self, node, inputs):
+        if node in self.deferred or (inputs and is_deferred(inputs[0])):
+            # 融合链内部只组合查找表或仿射矩阵, 链尾应用一次
+            outputs = run_fused(node.type, node.to_kernel(inputs), node in self.deferred, self.output_demand.get(node))
+            return node.from_kernel(outputs)
+        demand = self.output_demand.get(node)
+        if self.processes is not None and node.process_safe:
+            outputs = self.processes.run(node.type, node.to_kernel(inputs), demand)
+            return node.from_kernel(outputs)
+        return node.compute(inputs, demand)
+
+    def compute_checked(self, node, inputs):
+        """在当前线程计算 (非线程安全的旧式节点在界面线程中计算), 失败时通知"""
+        try:
+            if not getattr(node, "thread_safe", True) and self.main_thread_call is not None:
+                return self.main_thread_call(lambda: self.compute_node(node, inputs))
+            return self.compute_node(node, inputs)
+        except ExecutionCancelled:
+            raise
+        except Exception as e:
+            self.node_failed(node, e)
+            raise
+
+    def node_failed(self, node, error):
+        print(f"节点 {node} 执行失败: {str(error)}")
+        if self.on_node_failed is not None:
+            self.on_node_failed(node, error)
+
+    def commit_node(self, node, key, outputs):
+        """写回输出并记录缓存"""
+        if self.preview is not None:
+            outputs = self.proxy_outputs(node, outputs)
+        if key is not None and node not in self.deferred:
+            self.cache.put(key, outputs)
+        if self.preview is not None:
+            # 缓存中保存代理图像上的值, 每次写回时换算, 命中缓存时不会重复换算
+            outputs = self.scale_pixel_outputs(node, outputs)
+        demand = self.output_demand.get(node)
+        kept = missing = set()
+        if demand is not None:
+            indices = {socket.index for socket in node.output_sockets}
+            # 节点未变时只是补算缺失的输出, 之前算好的输出继续有效
+            if not node.dirty:
+                kept = indices - node.missing_outputs - demand
+            outputs = list(outputs)
+            for index in kept:
+                outputs[index] = node.output_sockets[index].value
+            missing = indices - demand - kept
+        node.set_outputs(outputs)
+        for socket in node.output_sockets:
+            if socket.index in kept:
+                continue
+            computed = key is not None and socket.index not in missing
+            socket.value_key = (key, socket.index) if computed else None
+        node.missing_outputs = missing
+        if node in self.deferred:
+            # 延迟的输出只对本次执行的下游有效, 以后需要时重新计算
+            node.missing_outputs = missing | {socket.index for socket in node.output_sockets}
+        self.clear_dirty(node)
+        if self.preview is not None:
+            # 输出只是预览, 节点及其下游仍需全分辨率计算
+            mark_dirty(node)
+        if self.release_intermediates:
+            self.release_inputs(node)
+        if self.on_node_finished is not None:
+            self.on_node_finished(node)
+
+    def node_scale(self, node):
+        """预览时节点处理的图像相对代理图像的比例, 取第一个连接的图像输入"""
+        for socket in node.input_sockets:
+            upstream = upstream_socket(socket)
+            if socket.datatype == 1 and upstream in self.proxy_scales:
+                return self.proxy_scales[upstream]
+        return (1.0, 1.0)
+
+    def proxy_outputs(self, node, outputs):
+        """源节点输出的图像换成代理图像 (已是代理时原样返回), 记录每个图像输出的比例"""
+        outputs = list(outputs)
+        scale = self.node_scale(node)
+        for socket in node.output_sockets:
+            value = outputs[socket.index]
+            if not node.input_sockets and isinstance(value, np.ndarray):
+                outputs[socket.index] = proxy_image(value, self.preview)
+                self.proxy_scales[socket] = proxy_scale(outputs[socket.index])
+            elif socket.datatype == 1:
+                self.proxy_scales[socket] = scale
+        return outputs
+
+    def scale_pixel_inputs(self, node, inputs):
+        """以像素为单位的参数 (如裁剪区域) 按代理图像的比例缩小"""
+        spec = NODE_SPECS.get(node.type)
+        if spec is None or not spec["pixel_inputs"]:
+            return inputs
+        scale = self.node_scale(node)
+        inputs = list(inputs)
+        for index, axis in spec["pixel_inputs"].items():
+            if isinstance(inputs[index], (int, float)):
+                inputs[index] = inputs[index] / scale[0 if axis == "x" else 1]
+        return inputs
+
+    def scale_pixel_outputs(self, node, outputs):
+        """以像素为单位的输出 (如图像尺寸) 换算回全分辨率"""
+        spec = NODE_SPECS.get(node.type)
+        if spec is None or not spec["pixel_outputs"]:
+            return outputs
+        scale = self.node_scale(node)
+        outputs = list(outputs)
+        for index, axis in spec["pixel_outputs"].items():
+            if isinstance(outputs[index], (int, float)):
+                outputs[index] = round(outputs[index] * scale[0 if axis == "x" else 1])
+        return outputs
+
+    def clear_dirty(self, node):
+        """执行期间节点被修改 (修改代数变化) 或上游又变脏时保持脏状态, 下次执行时重新计算"""
+        with DIRTY_LOCK:
+            if getattr(node, "edit_generation", 0) != self.generations.pop(node, None):
+                return
+            if any(getattr(upstream, "dirty", False) for upstream in upstream_nodes(node)):
+                return
+            node.dirty = False
+
+    def node_key(self, node, demand=None):
+        """缓存键: 节点类型、未连接插座的参数指纹、上游输出的键、需要的输出、预览宽度和是否应用融合链,
+        无法确定时返回None
+
+        融合的仿射链只重采样一次, 结果与逐个执行不同, 因此两种方式的结果分别缓存。
+        """
+        parts = []
+        fused = False
+        sockets = node.input_sockets or node.output_sockets
+        for socket in sockets:
+            if socket.type == 0 and socket.has_edge():
+                upstream = upstream_socket(socket)
+                part = upstream.value_key if upstream is not None else None
+                fused = fused or (upstream is not None and upstream.node in self.deferred)
+            else:
+                part = fingerprint(self.param(socket))
+            if part is None:
+                return None
+            parts.append(part)
+        return (node.type, tuple(parts), tuple(sorted(demand)) if demand is not None else None, self.preview, fused)
+
+    def pull_inputs(self, node):
+        """从上游输出插座拉取数据"""
+        for socket in node.input_sockets:
+            for edge in socket.edges:
+                edge.transfer_value()
 
     def reset(self):
         for node in self.nodes:
             node.reset()
+            node.dirty = True
+            node.missing_outputs = set()
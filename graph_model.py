@@ -0,0 +1,197 @@
+# graph_model.py
+"""无界面的图数据模型
+
+节点、插座、边与参数值均为纯数据, 计算由 kernels 中的内核完成,
+不需要 QApplication。属性命名与界面层保持一致, Graph 可以直接执行。
+"""
+import json
+from kernels import NODE_SPECS, run_kernel, is_process_safe
+from graph import mark_dirty, is_output_node
+from topology import Topology
+
+INPUT = 0
+OUTPUT = 1
+
+
+class ModelSocket:
+    def __init__(self, node, index=0, type=0, datatype=1, box_type=0):
+        self.node = node
+        self.index = index
+        self.type = type  # 0表示输入，1表示输出
+        self.datatype = datatype
+        self.box_type = box_type  # 非0表示该插座带有参数
+        self.edges = []
+        self._value = None
+        self._param = None  # 对应界面中输入框的值
+        self.value_key = None  # 产生当前输出的缓存键
+        self.pinned = False  # 固定的插座执行后保留值, 不随中间结果释放
+
+    @property
+    def param(self):
+        return self._param
+
+    @param.setter
+    def param(self, new_param):
+        self._param = new_param
+        self.node.mark_dirty()
+
+    @property
+    def value(self):
+        if self.type == OUTPUT or self.has_edge():
+            return self._value
+        return self.param
+
+    @value.setter
+    def value(self, new_value):
+        self._value = new_value
+
+    def reset(self):
+        self._value = None
+        self.value_key = None
+
+    def has_edge(self):
+        return len(self.edges) > 0
+
+
+class ModelNode:
+    thread_safe = True
+
+    def __init__(self, type):
+        spec = NODE_SPECS.get(type)
+        if spec is None:
+            raise ValueError(f"未知的节点类型: {type}")
+        self.type = type
+        self.title = spec["title"]
+        self.dirty = True
+        self.missing_outputs = set()
+        self.edit_generation = 0
+        self.input_sockets = [
+            ModelSocket(self, i, INPUT, config.get("datatype", 0), config.get("box_type", 0))
+            for i, config in enumerate(spec["input_sockets"])
+        ]
+        self.output_sockets = [
+            ModelSocket(self, i, OUTPUT, config.get("datatype", 0), config.get("box_type", 0))
+            for i, config in enumerate(spec["output_sockets"])
+        ]
+
+    def get_inputs(self):
+        """收集计算内核的输入, 源节点取输出插座上的参数"""
+        if self.input_sockets:
+            return [socket.value for socket in self.input_sockets]
+        return [socket.param for socket in self.output_sockets]
+
+    @property
+    def process_safe(self):
+        return is_process_safe(self.type)
+
+    def to_kernel(self, inputs):
+        return inputs
+
+    def from_kernel(self, outputs):
+        return list(outputs)
+
+    def compute(self, inputs, demand=None):
+        return self.from_kernel(run_kernel(self.type, self.to_kernel(inputs), demand))
+
+    def set_outputs(self, outputs):
+        for socket, value in zip(self.output_sockets, outputs):
+            socket.value = value
+
+    def run(self):
+        self.set_outputs(self.compute(self.get_inputs()))
+
+    def mark_dirty(self):
+        mark_dirty(self)
+
+    def reset(self):
+        for socket in self.input_sockets + self.output_sockets:
+            socket.reset()
+
+    def __repr__(self):
+        return f"<ModelNode {self.type} {self.title}>"
+
+
+class ModelEdge:
+    def __init__(self, start_socket, end_socket):
+        self.start_socket = start_socket
+        self.end_socket = end_socket
+        if start_socket.type == OUTPUT:
+            self.output_socket, self.input_socket = start_socket, end_socket
+        else:
+            self.output_socket, self.input_socket = end_socket, start_socket
+
+    def transfer_value(self):
+        self.input_socket.value = self.output_socket.value
+
+
+class GraphModel:
+    """与Scene接口一致的纯数据图"""
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.topology = Topology()
+
+    def add_node(self, node):
+        if isinstance(node, int):
+            node = ModelNode(node)
+        self.nodes.append(node)
+        self.topology.add_node(node)
+        return node
+
+    def add_edge(self, edge):
+        if edge not in self.edges:
+            self.topology.add_edge(edge.output_socket.node, edge.input_socket.node)
+            self.edges.append(edge)
+            edge.output_socket.edges.append(edge)
+            edge.input_socket.edges.append(edge)
+            edge.input_socket.node.mark_dirty()
+        return edge
+
+    def connect(self, output_socket, input_socket):
+        return self.add_edge(ModelEdge(output_socket, input_socket))
+
+    def remove_node(self, node):
+        if node in self.nodes:
+            for socket in node.input_sockets + node.output_sockets:
+                for edge in socket.edges.copy():
+                    self.remove_edge(edge)
+            self.nodes.remove(node)
+            self.topology.remove_node(node)
+
+    def remove_edge(self, edge):
+        if edge in self.edges:
+            self.edges.remove(edge)
+            self.topology.remove_edge(edge.output_socket.node, edge.input_socket.node)
+            edge.output_socket.edges.remove(edge)
+            edge.input_socket.edges.remove(edge)
+            edge.input_socket.node.mark_dirty()
+
+    @classmethod
+    def from_dict(cls, data):
+        """加载 SceneSerializer 导出的数据"""
+        model = cls()
+        for node_data in data["nodes"]:
+            node = model.add_node(node_data["type"])
+            values = node_data.get("values", {})
+            for socket, value in zip(node.input_sockets, values.get("inputs", [])):
+                socket.param = value
+            for socket, value in zip(node.output_sockets, values.get("outputs", [])):
+                socket.param = value
+        for edge_data in data["edges"]:
+            start_node = model.nodes[edge_data["start_node"]]
+            end_node = model.nodes[edge_data["end_node"]]
+            model.connect(
+                start_node.output_sockets[edge_data["start_socket"]],
+                end_node.input_sockets[edge_data["end_socket"]],
+            )
+        return model
+
+    def output_nodes(self):
+        return [node for node in self.nodes if is_output_node(node)]
+
+
+def load_graph_model(filepath):
+    """从场景文件加载无界面的图模型"""
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return GraphModel.from_dict(data)
@@ -0,0 +1,96 @@
+# graph_runner.py
+"""在工作线程中执行图, 通过信号向界面报告进度"""
+import threading
+from PySide6.QtCore import QObject, QThread, Qt, Signal
+from graph import ExecutionCancelled
+
+
+class MainThreadInvoker(QObject):
+    """在界面线程中执行函数, 调用线程等待执行完成; 须在界面线程中创建
+
+    等待期间执行被取消而函数尚未开始时放弃调用, 界面线程等待执行线程结束时因此不会死锁。
+    """
+    requested = Signal(object)
+
+    def __init__(self, cancel_event, parent=None):
+        super().__init__(parent)
+        self.cancel_event = cancel_event
+        self.requested.connect(self.invoke, Qt.QueuedConnection)
+
+    def invoke(self, call):
+        with call.lock:
+            if call.abandoned:
+                return
+            call.started = True
+        try:
+            call.result = call.func()
+        except BaseException as e:
+            call.error = e
+        finally:
+            call.done.set()
+
+    def call(self, func):
+        if QThread.currentThread() == self.thread():
+            return func()
+        call = _Call(func)
+        self.requested.emit(call)
+        while not call.done.wait(0.05):
+            if self.cancel_event.is_set():
+                with call.lock:
+                    if not call.started:
+                        call.abandoned = True
+                        raise ExecutionCancelled("执行已取消")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class _Call:
+    def __init__(self, func):
+        self.func = func
+        self.result = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.started = False
+        self.abandoned = False
+        self.done = threading.Event()
+
+
+class GraphRunner(QThread):
+    node_started = Signal(object)
+    node_finished = Signal(object)
+    node_failed = Signal(object, str)
+    completed = Signal()
+    cancelled = Signal()
+    failed = Signal(str)
+
+    def __init__(self, graph, targets=None, parent=None, preview=None):
+        super().__init__(parent)
+        self.graph = graph
+        self.targets = targets
+        self.preview = preview  # 预览宽度, None表示全分辨率
+        # 每次执行使用自己的取消标志, 启动前发出的取消同样生效, 也不会影响之后的执行
+        self.cancel_event = threading.Event()
+        graph.cancel_event = self.cancel_event
+        # 执行线程不访问控件, 输入框的参数在界面线程中事先记录
+        self.params = graph.snapshot_params()
+        # 回调在工作线程中调用, 信号以排队方式送到界面线程
+        graph.on_node_started = self.node_started.emit
+        graph.on_node_finished = self.node_finished.emit
+        graph.on_node_failed = lambda node, error: self.node_failed.emit(node, str(error))
+        # 旧式节点的run()可能访问控件, 转到界面线程执行
+        self.invoker = MainThreadInvoker(self.cancel_event, self)
+        graph.main_thread_call = self.invoker.call
+
+    def run(self):
+        try:
+            self.graph.execute(self.targets, self.preview, self.params)
+        except ExecutionCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.completed.emit()
+
+    def cancel(self):
+        self.cancel_event.set()
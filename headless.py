@@ -0,0 +1,85 @@
+# headless.py
+"""无界面运行场景文件: python headless.py scene.json [-o 输出目录]
+
+批处理: python headless.py scene.json -o 输出目录 --batch 图片目录 "*.jpg" ...
+"""
+import argparse
+import os
+import sys
+from batch import QUEUE_SIZE, run_batch
+from graph import Graph
+from graph_model import load_graph_model
+from kernels import save_image
+from process_pool import ProcessBackend
+from tiled import run_tiled
+
+
+def run_file(
+    filepath, output_dir=None, workers=1, processes=None, low_memory=False, preview=None, fuse=True, tile_size=None,
+):
+    """执行场景文件, 返回各输出节点的值
+
+    low_memory: 中间结果在下游执行完后立即释放
+    preview: 预览宽度, 以缩小的代理图像快速执行
+    fuse: 融合连续的逐像素节点和几何节点
+    tile_size: 分块执行的块大小, 图像输出逐块写入 output_dir 下的 .npy 文件
+    """
+    model = load_graph_model(filepath)
+    if tile_size is not None:
+        if output_dir is None:
+            raise ValueError("分块执行需要指定输出目录")
+        return run_tiled(model, output_dir, tile_size)
+    # 只计算输出节点需要的分支
+    Graph(
+        model, workers=workers, processes=processes, demand_driven=True, release_intermediates=low_memory, fuse_nodes=fuse,
+    ).execute(preview=preview)
+    results = []
+    for index, node in enumerate(model.output_nodes()):
+        value = node.input_sockets[0].value if node.input_sockets else None
+        if output_dir is not None and node.input_sockets and node.input_sockets[0].datatype == 1 and value is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            save_image(value, os.path.join(output_dir, f"output_{index}.png"))
+        results.append((node, value))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面执行节点图")
+    parser.add_argument("scene", help="SceneSerializer 导出的场景文件")
+    parser.add_argument("-o", "--output-dir", help="图像输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="并行线程数")
+    parser.add_argument("-p", "--processes", type=int, default=0, help="工作进程数, 0表示不使用进程池")
+    parser.add_argument("--low-memory", action="store_true", help="及时释放中间结果, 降低峰值内存")
+    parser.add_argument("--no-fusion", action="store_true", help="不融合相邻节点, 用于调试")
+    parser.add_argument("--preview", type=int, metavar="WIDTH", help="以约为该宽度的代理图像快速预览")
+    parser.add_argument("--tile", type=int, metavar="SIZE", help="分块执行超大图像 (.npy 输入), 输出写为 .npy")
+    parser.add_argument("--batch", nargs="+", metavar="INPUT", help="批处理: 目录、通配符或文件, 逐个送入第一个图像输入节点")
+    parser.add_argument("--ext", default=".png", help="批处理输出的图片格式")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="批处理每个阶段之间最多等待的图片数")
+    args = parser.parse_args()
+    if (args.tile is not None or args.batch) and args.output_dir is None:
+        parser.error("--tile 与 --batch 需要同时指定 -o")
+    if args.batch:
+        results = run_batch(args.scene, args.batch, args.output_dir, args.workers, not args.no_fusion, args.ext, args.queue)
+        failed = sum(not result.ok for result in results)
+        print(f"批处理完成: {len(results)} 个文件, 失败 {failed} 个")
+        sys.exit(1 if failed else 0)
+    processes = ProcessBackend(args.processes) if args.processes > 0 else None
+    try:
+        results = run_file(
+            args.scene, args.output_dir, args.workers, processes, args.low_memory, args.preview, not args.no_fusion,
+            args.tile,
+        )
+    finally:
+        if processes is not None:
+            processes.shutdown()
+    if args.preview is not None:
+        print(f"预览模式: 代理图像宽度约 {args.preview}px")
+    for node, value in results:
+        if node.input_sockets and node.input_sockets[0].datatype == 1:
+            value = None if value is None else f"image {value.shape}"
+        print(f"{node.title}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# image_bridge.py
+"""QImage 与 OpenCV Mat (numpy 数组) 之间的转换
+
+图像在插座与连接之间始终以数组 (BGR, uint8) 传递, 只在显示与保存时转换为QImage。
+两个转换函数都接受已经是目标类型的值, 旧式节点混用QImage与数组时仍然可以工作。
+
+转换不复制像素: 根据数组布局选择对应的QImage格式 (BGR888 / Grayscale8 / ARGB32),
+不需要交换通道; 得到的对象持有原始数据的所有者, 原对象被释放后仍然有效。
+Qt内部隐式共享产生的QImage副本不会持有数组, 需要长期保存时请调用 copy()。
+"""
+import sys
+from PySide6.QtGui import QImage
+import cv2
+import numpy as np
+
+# 可以直接包装为数组的QImage格式 -> 通道数 (内存中的顺序即BGR / 灰度)
+_VIEW_FORMATS = {
+    QImage.Format_BGR888: 3,
+    QImage.Format_Grayscale8: 1,
+}
+
+
+class _QImageBuffer:
+    """通过 __array_interface__ 导出QImage的像素, 数组的base持有本对象, 从而持有QImage"""
+    def __init__(self, qimg, channels):
+        self.qimg = qimg
+        height, width = qimg.height(), qimg.width()
+        # constBits不会触发隐式共享的分离, 不复制数据
+        bits = np.frombuffer(qimg.constBits(), dtype=np.uint8)
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        strides = (qimg.bytesPerLine(), 1) if channels == 1 else (qimg.bytesPerLine(), channels, 1)
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": shape,
+            "typestr": "|u1",
+            "strides": strides,
+            "data": (bits.ctypes.data, True),  # 只读视图
+        }
+
+
+def qimage_to_mat(qimg):
+    """将QImage转换为OpenCV Mat (只读视图, 按行跨度访问, 不复制)"""
+    if qimg is None or isinstance(qimg, np.ndarray):
+        return qimg
+    channels = _VIEW_FORMATS.get(qimg.format())
+    if channels is None:
+        # 其他格式先转换为BGR888, 视图持有转换后的图像
+        qimg = qimg.convertToFormat(QImage.Format_BGR888)
+        channels = 3
+    return np.asarray(_QImageBuffer(qimg, channels))
+
+
+def _qimage_format(mat):
+    """与数组内存布局一致的QImage格式, 没有对应格式时返回None"""
+    if mat.ndim == 2 or (mat.ndim == 3 and mat.shape[2] == 1):
+        return QImage.Format_Grayscale8
+    if mat.ndim == 3 and mat.shape[2] == 3:
+        return QImage.Format_BGR888
+    if mat.ndim == 3 and mat.shape[2] == 4 and sys.byteorder == "little":
+        # 小端序下ARGB32在内存中的顺序为B、G、R、A, 与OpenCV的BGRA一致
+        return QImage.Format_ARGB32
+    return None
+
+
+def mat_to_qimage(mat):
+    """将OpenCV Mat转换为QImage (共享数组内存, 不复制)"""
+    if mat is None or isinstance(mat, QImage):
+        return mat
+    if mat.dtype != np.uint8:
+        mat = np.clip(mat, 0, 255).astype(np.uint8)
+    qformat = _qimage_format(mat)
+    if qformat is None:
+        # 大端序的BGRA: 交换为RGBA后使用RGBA8888
+        mat = cv2.cvtColor(mat, cv2.COLOR_BGRA2RGBA)
+        qformat = QImage.Format_RGBA8888
+    if mat.size == 0:
+        return QImage()
+    channels = 1 if mat.ndim == 2 else mat.shape[2]
+    height, width = mat.shape[:2]
+    # 行内像素必须连续, 行与行之间可以有跨度 (例如裁剪得到的视图)
+    if mat.strides[-1] != 1 or mat.strides[0] < width * channels or (mat.ndim == 3 and mat.strides[1] != channels):
+        mat = np.ascontiguousarray(mat)
+    # 覆盖首行到末行的一维连续视图, 跨行的视图也可以直接交给QImage
+    span = mat.strides[0] * (height - 1) + width * channels
+    buffer = np.lib.stride_tricks.as_strided(mat, shape=(span,), strides=(1,))
+    qimg = QImage(buffer.data, width, height, mat.strides[0], qformat)
+    qimg._owner = buffer  # QImage不拥有数据, 由它持有数组
+    return qimg
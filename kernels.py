@@ -0,0 +1,401 @@
+# kernels.py
+"""纯计算内核
+
+每种节点类型对应一个与界面无关的计算函数:
+输入为各输入插座的值, 返回各输出插座的值组成的元组。
+图像统一使用 numpy 数组 (uint8): 彩色为 (高, 宽, 3) 的BGR, 灰度与单通道为 (高, 宽),
+图像节点接受两种布局。不依赖 Qt, 可在无界面的服务器上运行。
+"""
+import os
+import weakref
+import cv2
+import numpy as np
+from buffer_pool import BUFFER_POOL
+
+KERNELS = {}  # node.type -> 计算函数
+NODE_SPECS = {}  # node.type -> 节点定义 (标题与插座配置, 格式同 Node)
+_pyramids = {}  # id(image) -> (weakref, [逐级缩小的图像]), 预览时复用
+_proxy_scales = {}  # id(代理图像) -> (weakref, (宽度比例, 高度比例)), 原图相对代理图像的比例
+
+
+def kernel(
+    node_type, title, input_sockets=(), output_sockets=(), process_safe=False, uses_demand=False, pointwise=False,
+    affine=None, halo=None, pixel_inputs=None, pixel_outputs=None,
+):
+    """注册计算内核及其节点定义
+
+    process_safe: 内核可以在独立进程中执行 (输入输出均可跨进程传递)
+    uses_demand: 内核接受demand参数, 只计算其中列出的输出插座, 其余输出为None
+    pointwise: 第一个输入为图像、唯一输出为同尺寸图像, 且每个像素值只取决于自身 (可融合为查找表)
+    affine: 几何变换节点的仿射函数 (输入尺寸, *参数) -> (2x3矩阵, 输出尺寸), 可与相邻节点合并为一次warpAffine
+    halo: 输出与输入同尺寸且每个像素只取决于邻域时, 邻域每边超出的像素数 (逐像素为0), 可以分块执行;
+        None表示需要整幅图像
+    pixel_inputs / pixel_outputs: 以像素为单位的数字插座, 插座序号 -> 方向 ("x"宽度 / "y"高度);
+        预览时输入按代理图像的比例缩小, 输出换算回全分辨率
+    """
+    def decorator(func):
+        KERNELS[node_type] = func
+        NODE_SPECS[node_type] = {
+            "title": title,
+            "input_sockets": list(input_sockets),
+            "output_sockets": list(output_sockets),
+            "process_safe": process_safe,
+            "uses_demand": uses_demand,
+            "pointwise": pointwise,
+            "affine": affine,
+            "halo": halo,
+            "pixel_inputs": pixel_inputs or {},
+            "pixel_outputs": pixel_outputs or {},
+        }
+        return func
+    return decorator
+
+
+def is_process_safe(node_type):
+    spec = NODE_SPECS.get(node_type)
+    return spec is not None and spec["process_safe"]
+
+
+def get_kernel(node_type):
+    """根据node.type获取计算内核"""
+    if node_type in KERNELS:
+        return KERNELS[node_type]
+    raise ValueError(f"未知的节点类型: {node_type}")
+
+
+def run_kernel(node_type, inputs, demand=None):
+    """执行内核, demand为需要计算的输出插座序号集合, None表示全部"""
+    func = get_kernel(node_type)
+    if demand is not None and NODE_SPECS[node_type]["uses_demand"]:
+        return func(*inputs, demand=demand)
+    return func(*inputs)
+
+
+def output_buffer(shape, dtype=np.uint8):
+    """内核输出用的缓冲区 (作为cv2的dst), 从缓冲区池中取得; 为None时由cv2自行分配"""
+    return BUFFER_POOL.take(shape, dtype)
+
+
+def load_image(source):
+    """读取图片: 支持文件路径或已解码的数组, .npy文件以只读的内存映射打开, 按需读取"""
+    if source is None or isinstance(source, np.ndarray):
+        return source
+    if str(source).lower().endswith(".npy"):
+        return np.load(source, mmap_mode="r")
+    # 使用imdecode以支持中文路径
+    data = np.fromfile(source, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"无法读取图片: {source}")
+    return image
+
+
+def save_image(image, filepath):
+    """保存图片, 使用imencode以支持中文路径"""
+    ext = os.path.splitext(filepath)[1] or ".png"
+    ok, data = cv2.imencode(ext, image)
+    if not ok:
+        raise ValueError(f"无法编码图片: {filepath}")
+    data.tofile(filepath)
+
+
+def proxy_image(image, target_width):
+    """预览用的代理图像: 图像金字塔中宽度不小于target_width的最小一级
+
+    同一幅图像的金字塔只计算一次, 原图被释放时随之丢弃。
+    """
+    if image is None or target_width is None or image.shape[1] // 2 < target_width:
+        return image
+    entry = _pyramids.get(id(image))
+    if entry is None or entry[0]() is not image:
+        ref = weakref.ref(image, lambda ref, key=id(image): _pyramids.pop(key, None))
+        entry = (ref, [])  # 只保存缩小后的各级, 不持有原图
+        _pyramids[id(image)] = entry
+    levels = entry[1]
+    level, index = image, 0
+    while level.shape[1] // 2 >= target_width:
+        if index == len(levels):
+            down = cv2.pyrDown(level)
+            levels.append(down)
+            scale = (image.shape[1] / down.shape[1], image.shape[0] / down.shape[0])
+            _proxy_scales[id(down)] = (weakref.ref(down, lambda ref, key=id(down): _proxy_scales.pop(key, None)), scale)
+        level = levels[index]
+        index += 1
+    return level
+
+
+def proxy_scale(image):
+    """原图相对代理图像的 (宽度, 高度) 比例, 不是代理图像时为 (1, 1)"""
+    entry = _proxy_scales.get(id(image))
+    if entry is None or entry[0]() is not image:
+        return (1.0, 1.0)
+    return entry[1]
+
+
+def _same_layout(image1, image2):
+    """两幅图像通道数不同时将单通道图像扩展为BGR"""
+    if image1.ndim == image2.ndim:
+        return image1, image2
+    if image1.ndim == 2:
+        return cv2.cvtColor(image1, cv2.COLOR_GRAY2BGR), image2
+    return image1, cv2.cvtColor(image2, cv2.COLOR_GRAY2BGR)
+
+
+def _numbers(values):
+    """计算前统一处理None值"""
+    return [0 if value is None else value for value in values]
+
+
+# 输入节点
+@kernel(1001, "Input", output_sockets=[{"datatype": 0, "box_type": 1}])
+def number_input(value):
+    return (value,)
+
+
+@kernel(2001, "Image Input", output_sockets=[{"datatype": 1, "box_type": 2}])
+def image_input(image):
+    return (load_image(image),)
+
+
+@kernel(1003, "Test", output_sockets=[{"datatype": 0, "box_type": 3}])
+def test_input(value):
+    return (value,)
+
+
+# 输出节点: 值保留在输入插座上用于显示
+@kernel(1002, "Number Output", input_sockets=[{"datatype": 0, "box_type": 1}])
+def number_output(value):
+    return ()
+
+
+@kernel(2002, "Image Output", input_sockets=[{"datatype": 1, "box_type": 2}])
+def image_output(image):
+    return ()
+
+
+# 计算节点
+_BINARY = [{"datatype": 0, "box_type": 1}, {"datatype": 0, "box_type": 1}]
+_NUMBER = [{"datatype": 0}]
+
+
+@kernel(1101, "Sum", _BINARY, _NUMBER)
+def sum_(*values):
+    """计算所有输入值的和"""
+    return (sum(_numbers(values)),)
+
+
+@kernel(1102, "Subtract", _BINARY, _NUMBER)
+def subtract(a, b):
+    """计算两个输入值的差"""
+    a, b = _numbers((a, b))
+    return (a - b,)
+
+
+@kernel(1103, "Multiply", _BINARY, _NUMBER)
+def multiply(a, b):
+    """计算两个输入值的乘积"""
+    a, b = _numbers((a, b))
+    return (a * b,)
+
+
+@kernel(1104, "Divide", _BINARY, _NUMBER)
+def divide(a, b):
+    """计算两个输入值的商"""
+    a, b = _numbers((a, b))
+    return (a / b if b != 0 else None,)
+
+
+@kernel(1105, "Power", _BINARY, _NUMBER)
+def power(base, exponent):
+    """计算幂运算"""
+    base, exponent = _numbers((base, exponent))
+    return (base ** exponent,)
+
+
+@kernel(1106, "Sqrt", [{"datatype": 0, "box_type": 1}], _NUMBER)
+def sqrt(value):
+    """计算平方根"""
+    value = 0 if value is None else value
+    return (value ** 0.5 if value >= 0 else None,)
+
+
+# 图像处理节点
+_IMAGE = [{"datatype": 1}]
+
+
+@kernel(2101, "Grayscale", _IMAGE, _IMAGE, process_safe=True, halo=0)
+def grayscale(image):
+    """将彩色图像转换为单通道灰度图像"""
+    if image is None or image.ndim == 2:
+        return (image,)
+    return (cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=output_buffer(image.shape[:2])),)
+
+
+def flip_affine(size, direction):
+    """翻转对应的仿射矩阵"""
+    width, height = size
+    if direction == 0:
+        matrix = [[-1, 0, width - 1], [0, 1, 0]]
+    elif direction == 1:
+        matrix = [[1, 0, 0], [0, -1, height - 1]]
+    else:
+        matrix = [[1, 0, 0], [0, 1, 0]]
+    return np.array(matrix, dtype=np.float64), size
+
+
+@kernel(2102, "Flip", _IMAGE + [{"datatype": 0, "box_type": 1}], _IMAGE, process_safe=True, affine=flip_affine)
+def flip(image, direction):
+    """根据方向翻转图像 (0:水平, 1:垂直)"""
+    if image is None:
+        return (None,)
+    if direction == 0:
+        return (cv2.flip(image, 1, dst=output_buffer(image.shape, image.dtype)),)
+    if direction == 1:
+        return (cv2.flip(image, 0, dst=output_buffer(image.shape, image.dtype)),)
+    return (image,)  # 无效方向，返回原图
+
+
+@kernel(2103, "Brightness", _IMAGE + [{"datatype": 0, "box_type": 3}], _IMAGE, process_safe=True, pointwise=True, halo=0)
+def brightness(image, value):
+    """调整图像亮度 (-100到100)"""
+    if image is None:
+        return (None,)
+    value = max(-100, min(100, value or 0))
+    beta = value * 2.55  # 将-100到100映射到-255到255
+    return (cv2.convertScaleAbs(image, dst=output_buffer(image.shape), alpha=1.0, beta=beta),)
+
+
+def rotate_affine(size, angle):
+    """旋转的仿射矩阵与扩展后的画布尺寸"""
+    (w, h) = size
+    center = (w // 2, h // 2)
+
+    # 计算旋转矩阵
+    M = cv2.getRotationMatrix2D(center, angle or 0, 1.0)
+
+    # 计算新的边界尺寸
+    cos = np.abs(M[0, 0])
+    sin = np.abs(M[0, 1])
+    new_w = int((h * sin) + (w * cos))
+    new_h = int((h * cos) + (w * sin))
+
+    # 调整旋转矩阵以考虑平移
+    M[0, 2] += (new_w / 2) - center[0]
+    M[1, 2] += (new_h / 2) - center[1]
+    return M, (new_w, new_h)
+
+
+@kernel(2104, "Rotate", _IMAGE + [{"datatype": 0, "box_type": 1}], _IMAGE, process_safe=True, affine=rotate_affine)
+def rotate(image, angle):
+    """旋转图像, 画布扩展以容纳整幅图像"""
+    if image is None:
+        return (None,)
+    M, size = rotate_affine((image.shape[1], image.shape[0]), angle)
+    dst = output_buffer((size[1], size[0]) + image.shape[2:], image.dtype)
+    return (cv2.warpAffine(image, M, size, dst=dst),)
+
+
+@kernel(2105, "Contrast", _IMAGE + [{"datatype": 0, "box_type": 3}], _IMAGE, process_safe=True, pointwise=True, halo=0)
+def contrast(image, value):
+    """调整图像对比度 (-100到100)"""
+    if image is None:
+        return (None,)
+    value = max(-100, min(100, value or 0))
+    alpha = (value + 100) / 100.0  # 将-100到100映射到0到2
+    return (cv2.convertScaleAbs(image, dst=output_buffer(image.shape), alpha=alpha, beta=0),)
+
+
+def _scaled_size(size, width_scale, height_scale):
+    """缩放后的尺寸, 比例限制在0.1到10.0之间"""
+    width_scale = max(0.1, min(10.0, float(width_scale or 1.0)))
+    height_scale = max(0.1, min(10.0, float(height_scale or 1.0)))
+    return int(size[0] * width_scale), int(size[1] * height_scale)
+
+
+def scale_affine(size, width_scale, height_scale):
+    """与 cv2.resize 相同的像素中心对齐方式的缩放矩阵"""
+    new_size = _scaled_size(size, width_scale, height_scale)
+    sx, sy = new_size[0] / size[0], new_size[1] / size[1]
+    matrix = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5]], dtype=np.float64)
+    return matrix, new_size
+
+
+@kernel(2106, "Scale", _IMAGE + [{"datatype": 0, "box_type": 1}, {"datatype": 0, "box_type": 1}], _IMAGE, process_safe=True, affine=scale_affine)
+def scale(image, width_scale, height_scale):
+    """缩放图像, 比例限制在0.1到10.0之间"""
+    if image is None:
+        return (None,)
+    new_size = _scaled_size((image.shape[1], image.shape[0]), width_scale, height_scale)
+    dst = output_buffer((new_size[1], new_size[0]) + image.shape[2:], image.dtype)
+    return (cv2.resize(image, new_size, dst=dst, interpolation=cv2.INTER_LINEAR),)
+
+
+def _crop_rect(size, x, y, width, height):
+    """限制在图像范围内的裁剪区域"""
+    image_width, image_height = size
+    x = int(max(0, min(x or 0, image_width - 1)))
+    y = int(max(0, min(y or 0, image_height - 1)))
+    width = int(min(width or image_width, image_width - x))
+    height = int(min(height or image_height, image_height - y))
+    return x, y, width, height
+
+
+def crop_affine(size, x, y, width, height):
+    """裁剪即平移, 输出尺寸为裁剪区域"""
+    x, y, width, height = _crop_rect(size, x, y, width, height)
+    return np.array([[1, 0, -x], [0, 1, -y]], dtype=np.float64), (max(width, 0), max(height, 0))
+
+
+@kernel(
+    2107, "Crop", _IMAGE + [{"datatype": 0, "box_type": 1}] * 4, _IMAGE, process_safe=True, affine=crop_affine,
+    pixel_inputs={1: "x", 2: "y", 3: "x", 4: "y"},
+)
+def crop(image, x, y, width, height):
+    """裁剪图像, 裁剪区域限制在图像范围内"""
+    if image is None:
+        return (None,)
+    x, y, width, height = _crop_rect((image.shape[1], image.shape[0]), x, y, width, height)
+    return (image[y:y+height, x:x+width],)
+
+
+@kernel(2108, "Image Overlay", _IMAGE + _IMAGE + [{"datatype": 0, "box_type": 1}], _IMAGE, process_safe=True, halo=0)
+def overlay(image1, image2, alpha):
+    """将两张图片按透明度叠加"""
+    if image1 is None or image2 is None:
+        return (None,)
+    alpha = max(0, min(1, alpha or 0.5))
+    height = max(image1.shape[0], image2.shape[0])
+    width = max(image1.shape[1], image2.shape[1])
+    # 尺寸相同时resize只是复制, 直接跳过
+    if image1.shape[:2] != (height, width):
+        image1 = cv2.resize(image1, (width, height))
+    if image2.shape[:2] != (height, width):
+        image2 = cv2.resize(image2, (width, height))
+    image1, image2 = _same_layout(image1, image2)
+    dst = output_buffer(image1.shape, image1.dtype)
+    return (cv2.addWeighted(image1, 1 - alpha, image2, alpha, 0, dst=dst),)
+
+
+@kernel(2109, "Image Size", _IMAGE, [{"datatype": 0, "box_type": 1}, {"datatype": 0, "box_type": 1}], pixel_outputs={0: "x", 1: "y"})
+def image_size(image):
+    """输出图像的宽度和高度"""
+    if image is None:
+        return (None, None)
+    height, width = image.shape[:2]
+    return (width, height)
+
+
+@kernel(2110, "RGB分离", _IMAGE, _IMAGE * 3, process_safe=True, uses_demand=True, halo=0)
+def rgb_split(image, demand=None):
+    """将输入图片分离为R、G、B三个单通道图像, 只生成需要的通道"""
+    if image is None:
+        return (None, None, None)
+    outputs = []
+    for index, channel in enumerate((2, 1, 0)):  # 输出顺序R、G、B, 对应BGR中的通道
+        if demand is not None and index not in demand:
+            outputs.append(None)
+        elif image.ndim == 2:
+            outputs.append(image)  # 灰度图像三个通道相同
+        else:
+            outputs.append(cv2.extractChannel(image, channel, dst=output_buffer(image.shape[:2], image.dtype)))
+    return tuple(outputs)
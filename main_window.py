@@ -1,9 +1,9 @@
 # main_window.py
-from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QFileDialog
-from PySide6.QtGui import QUndoStack, QAction
+from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QFileDialog, QApplication
+from PySide6.QtGui import QUndoStack, QAction, QActionGroup
 from scene import Scene
 from node_factory import NodeFactory
-from view import View
+from view import View, UPDATE_MODES, DEFAULT_UPDATE_MODE
 from edge import Edge
 from scene_serializer import save_scene_to_file, load_scene_from_file
 
@@ -35,8 +35,14 @@ class MainWindow(QMainWindow):
         # 创建view
         self.view = View(self.scene, self.undo_stack)
         self.layout.addWidget(self.view)
+        # 执行线程运行时被销毁会使进程中止, 退出前等待执行结束
+        QApplication.instance().aboutToQuit.connect(self.view.shutdown_graph)
         self.show()
 
+    def closeEvent(self, event):
+        self.view.shutdown_graph()
+        super().closeEvent(event)
+
     def create_menus(self):
         """创建菜单栏"""
         menubar = self.menuBar()
@@ -65,6 +71,17 @@ class MainWindow(QMainWindow):
         redo_action.triggered.connect(self.undo_stack.redo)
         edit_menu.addAction(redo_action)
 
+        # 视图菜单: 运行时切换视口刷新方式
+        view_menu = menubar.addMenu('视图')
+        update_menu = view_menu.addMenu('刷新方式')
+        update_group = QActionGroup(self)
+        for name, (label, _) in UPDATE_MODES.items():
+            action = QAction(label, self, checkable=True)
+            action.setChecked(name == DEFAULT_UPDATE_MODE)
+            action.triggered.connect(lambda checked, name=name: self.view.set_update_mode(name))
+            update_group.addAction(action)
+            update_menu.addAction(action)
+
     def import_scene(self):
         """导入场景"""
         filepath, _ = QFileDialog.getOpenFileName(
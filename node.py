@@ -1,23 +1,109 @@
 # node.py
 from PySide6.QtWidgets import QGraphicsItem,QGraphicsProxyWidget,QGraphicsTextItem,QLineEdit
-from PySide6.QtCore import QRectF, Qt, QPointF, QRegularExpression
-from PySide6.QtGui import QBrush, QPen, QColor, QPainterPath, QFont,QRegularExpressionValidator
+from PySide6.QtCore import QRectF, Qt, QPointF, QRegularExpression, QObject, QThread, Signal, QCoreApplication, QTimer
+from shiboken6 import isValid
+from PySide6.QtGui import QBrush, QPen, QColor, QPainterPath, QFont,QRegularExpressionValidator, QImage
 from node_socket import Socket
 from theme import Font, Color
+from kernels import KERNELS, NODE_SPECS, run_kernel, is_process_safe
+from graph import mark_dirty
+from image_bridge import qimage_to_mat, mat_to_qimage
 INPUT = 0
 OUTPUT = 1
 
+# 执行状态
+STATE_IDLE = 0
+STATE_RUNNING = 1
+STATE_FAILED = 2
+
+# 缩放级别对应的细节层次
+LOD_FULL = 0  # 完整绘制
+LOD_REDUCED = 1  # 不显示标题与输入框
+LOD_MINIMAL = 2  # 节点为纯色矩形, 不绘制插座, 边为直线
+LOD_REDUCED_SCALE = 0.4  # 缩放低于该值时进入LOD_REDUCED
+LOD_MINIMAL_SCALE = 0.2  # 缩放低于该值时进入LOD_MINIMAL
+
+
+def lod_for_scale(scale):
+    if scale < LOD_MINIMAL_SCALE:
+        return LOD_MINIMAL
+    if scale < LOD_REDUCED_SCALE:
+        return LOD_REDUCED
+    return LOD_FULL
+
+
+class Layer(QGraphicsItem):
+    """不绘制内容的容器, 透明度为0时其中的子项既不绘制也不响应鼠标"""
+    _bounding_rect = QRectF()
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemHasNoContents)
+
+    def boundingRect(self):
+        return self._bounding_rect
+
+    def paint(self, painter, option, widget=None):
+        pass
+
+
+class DisplayDispatcher(QObject):
+    """在界面线程中合并节点的重新布局: 同一轮事件循环中的多次请求只布局一次
+
+    工作线程中的请求经信号排队到界面线程; 执行一次图时每个改变过的节点最多重新布局一次。
+    """
+    requested = Signal(object)
+    _instance = None
+
+    def __init__(self):
+        super().__init__()
+        self.pending = {}  # 等待重新布局的节点, 按请求顺序
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.flush)
+        self.requested.connect(self.schedule)
+
+    def schedule(self, node):
+        """标记节点需要重新布局, 在下一轮事件循环中执行"""
+        self.pending[node] = None
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        for node in pending:
+            if isValid(node):  # 场景清空时节点可能已被删除
+                node.update_display()
+
+    @classmethod
+    def instance(cls):
+        # 在界面线程中第一次创建节点时构造, 使槽函数运行在界面线程
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
 class Node(QGraphicsItem):
 
     def __init__(
         self, 
-        title="Test Node", 
-        input_sockets=[],  # 格式: [{"datatype": int, "box_type": int}]
-        output_sockets=[],  # 格式: [{"datatype": int, "box_type": int}]
+        title=None,  # 未给出时取自NODE_SPECS[type], 未注册的类型为"Test Node"
+        input_sockets=None,  # 格式: [{"datatype": int, "box_type": int}], 未给出时同上
+        output_sockets=None,  # 格式: [{"datatype": int, "box_type": int}], 未给出时同上
         type=1001,
         ):
         
         super().__init__()
+        spec = NODE_SPECS.get(type, {"title": "Test Node", "input_sockets": [], "output_sockets": []})
+        title = spec["title"] if title is None else title
+        input_sockets = spec["input_sockets"] if input_sockets is None else input_sockets
+        output_sockets = spec["output_sockets"] if output_sockets is None else output_sockets
+        # 外形在update_display中计算并缓存, 绘制时直接使用
+        self._bounding_rect = QRectF()
+        self.path_title = QPainterPath()
+        self.path_content = QPainterPath()
+        self.path_outline = QPainterPath()
         self.opacity = 0.7  # 添加透明度参数，范围0-1
         self.title_height = 20
         self.title_font_color = QColor(Color.NODE_TITLE_FONT)
@@ -31,7 +117,17 @@ class Node(QGraphicsItem):
         self.edge_size = 3
         self.spacing = 7
         self.type = type
+        self.dirty = True  # 参数或连接改变后需要重新执行
+        self.edit_generation = 0  # 每次被标记为脏时加一
+        self.missing_outputs = set()  # 上次执行时未计算的输出插座
+        self.state = STATE_IDLE
+        self.preview = False  # 当前显示的是代理分辨率的预览结果
+        self.display_dispatcher = DisplayDispatcher.instance()
         self.initColor()
+        # 切换细节层次时只改变两个容器的透明度, 不逐个隐藏子项 (隐藏代理控件的代价很高)
+        self.widget_layer = Layer(self)  # 标题与输入框
+        self.socket_layer = Layer(self)  # 插座
+        self.lod = LOD_FULL
 
         self.title = title
 
@@ -61,6 +157,8 @@ class Node(QGraphicsItem):
             self.pen_default = QPen(QColor(Color.NODE_DEFAULT))
             self.pen_selected = QPen(QColor(Color.NODE_SELECTED))
             self.brush_title = QBrush(QColor(Color.NODE_TITLE))
+        self.pen_running = QPen(QColor(Color.NODE_RUNNING), 2)
+        self.pen_failed = QPen(QColor(Color.NODE_FAILED), 2)
         self.brush_title.color().setAlphaF(self.opacity)
         self.brush_background = QBrush(QColor(Color.BACKGROUND))
         self.brush_background.color().setAlphaF(self.opacity)
@@ -71,7 +169,7 @@ class Node(QGraphicsItem):
         self.setFlag(QGraphicsItem.ItemSendsScenePositionChanges)
 
     def initTitle(self):
-        self.title_item = QGraphicsTextItem(self)
+        self.title_item = QGraphicsTextItem(self.widget_layer)
         self.title_item.setDefaultTextColor(self.title_font_color)
         self.title_item.setFont(self.title_font)
         self.title_item.setPos(self.padding,0)
@@ -100,51 +198,157 @@ class Node(QGraphicsItem):
         
 
     def boundingRect(self):
-        return QRectF(
-            0,
-            0,
-            self.width,
-            self.height
-        ).normalized()
+        return self._bounding_rect
+
+    def update_shape(self):
+        """按当前尺寸重新计算包围矩形与绘制路径, 调用前需先prepareGeometryChange"""
+        self._bounding_rect = QRectF(0, 0, self.width, self.height).normalized()
+        # title (不透明)
+        path_title = QPainterPath()
+        path_title.setFillRule(Qt.WindingFill)
+        path_title.addRoundedRect(0,0,self.width,self.title_height,self.edge_size,self.edge_size)
+        path_title.addRect(0,self.title_height - self.edge_size,self.edge_size,self.edge_size)
+        path_title.addRect(self.width - self.edge_size,self.title_height - self.edge_size,self.edge_size,self.edge_size)
+        self.path_title = path_title.simplified()
+        # content (透明)
+        path_content = QPainterPath()
+        path_content.setFillRule(Qt.WindingFill)
+        path_content.addRoundedRect(0, self.title_height, self.width, self.content_height, self.edge_size, self.edge_size)
+        path_content.addRect(0, self.title_height, self.edge_size, self.edge_size)
+        path_content.addRect(self.width - self.edge_size, self.title_height, self.edge_size, self.edge_size)
+        self.path_content = path_content.simplified()
+        # outline
+        path_outline = QPainterPath()
+        path_outline.addRoundedRect(0,0,self.width,self.height,self.edge_size,self.edge_size)
+        self.path_outline = path_outline.simplified()
 
     def itemChange(self, change, value):
         if change == QGraphicsItem.ItemPositionHasChanged:
             for socket in self.input_sockets + self.output_sockets:
                 for edge in socket.edges:
                     edge.update_path()
+            scene = self.scene()
+            if scene is not None:
+                scene.grow_scene_rect(self.sceneBoundingRect())
         return super().itemChange(change, value)
 
+    def set_lod(self, lod):
+        """切换细节层次, 由场景在缩放跨越LOD_*_SCALE时调用"""
+        if lod == self.lod:
+            return
+        self.lod = lod
+        self.widget_layer.setOpacity(1.0 if lod == LOD_FULL else 0.0)
+        self.socket_layer.setOpacity(0.0 if lod == LOD_MINIMAL else 1.0)
+
     def paint(self, painter, QStyleOptionGraphicsItem, widget=None):
+        if self.lod == LOD_MINIMAL:
+            painter.fillRect(self._bounding_rect, self.brush_title)
+            pen = self.outline_pen()
+            if pen is not self.pen_default:
+                painter.setPen(pen)
+                painter.setBrush(Qt.NoBrush)
+                painter.drawRect(self._bounding_rect)
+            return
         # title (不透明)
-        path_title = QPainterPath()
-        path_title.setFillRule(Qt.WindingFill)
-        path_title.addRoundedRect(0,0,self.width,self.title_height,self.edge_size,self.edge_size)
-        path_title.addRect(0,self.title_height - self.edge_size,self.edge_size,self.edge_size)
-        path_title.addRect(self.width - self.edge_size,self.title_height - self.edge_size,self.edge_size,self.edge_size)
         painter.setPen(Qt.NoPen)
         painter.setBrush(self.brush_title)
-        painter.drawPath(path_title.simplified())
+        painter.drawPath(self.path_title)
 
         # content (透明)
         painter.setOpacity(self.opacity)
-        path_content = QPainterPath()
-        path_content.setFillRule(Qt.WindingFill)
-        path_content.addRoundedRect(0, self.title_height, self.width, self.content_height, self.edge_size, self.edge_size)
-        path_content.addRect(0, self.title_height, self.edge_size, self.edge_size)
-        path_content.addRect(self.width - self.edge_size, self.title_height, self.edge_size, self.edge_size)
-        painter.setPen(Qt.NoPen)
         painter.setBrush(self.brush_background)
-        painter.drawPath(path_content.simplified())
+        painter.drawPath(self.path_content)
         
         # outline
         painter.setOpacity(1.0)  # 恢复不透明
-        path_outline = QPainterPath()
-        path_outline.addRoundedRect(0,0,self.width,self.height,self.edge_size,self.edge_size)
-        painter.setPen(self.pen_default if not self.isSelected() else self.pen_selected)
+        painter.setPen(self.outline_pen())
         painter.setBrush(Qt.NoBrush)
-        painter.drawPath(path_outline.simplified())
+        painter.drawPath(self.path_outline)
 
 
+    def get_inputs(self):
+        """收集计算内核的输入, 源节点取输出插座上输入框的参数"""
+        if self.input_sockets:
+            return [socket.value for socket in self.input_sockets]
+        return [socket.param for socket in self.output_sockets]
+
+    @property
+    def process_safe(self):
+        """内核可以在独立进程中执行, 子类可用类属性覆盖"""
+        return is_process_safe(self.type)
+
+    @property
+    def thread_safe(self):
+        """compute可以在工作线程中执行; 旧式节点直接读写插座, 在调度线程中执行"""
+        return not self.legacy
+
+    @property
+    def legacy(self):
+        """没有注册内核、自行实现run()的旧式节点"""
+        return self.type not in KERNELS and type(self).run is not Node.run
+
+    def to_kernel(self, inputs):
+        """图像以数组传递, 兼容旧式节点写入的QImage (复制为可写数组)"""
+        return [qimage_to_mat(value).copy() if isinstance(value, QImage) else value for value in inputs]
+
+    def from_kernel(self, outputs):
+        return list(outputs)
+
+    def compute(self, inputs, demand=None):
+        """调用纯计算内核, demand为需要计算的输出插座序号"""
+        if self.legacy:
+            # 旧式节点直接读写插座, 输入已由Graph拉取到插座上;
+            # 执行期间图像输入以QImage副本提供 (与旧接口一致), 结束后恢复为数组
+            arrays = [socket._value for socket in self.input_sockets]
+            for socket in self.input_sockets:
+                if socket.datatype == 1 and socket._value is not None and not isinstance(socket._value, QImage):
+                    socket._value = mat_to_qimage(socket._value).copy()
+            try:
+                self.run()
+            finally:
+                for socket, value in zip(self.input_sockets, arrays):
+                    socket._value = value
+            return self.to_kernel([socket._value for socket in self.output_sockets])
+        return self.from_kernel(run_kernel(self.type, self.to_kernel(inputs), demand))
+
+    def set_outputs(self, outputs):
+        for socket, value in zip(self.output_sockets, outputs):
+            socket.value = value
+
+    def run(self):
+        self.set_outputs(self.compute(self.get_inputs()))
+
+    def mark_dirty(self):
+        mark_dirty(self)
+
+    def outline_pen(self):
+        if self.isSelected():
+            return self.pen_selected
+        if self.state == STATE_RUNNING:
+            return self.pen_running
+        if self.state == STATE_FAILED:
+            return self.pen_failed
+        return self.pen_default
+
+    def set_state(self, state):
+        """更新执行状态并重绘轮廓"""
+        self.state = state
+        self.update()
+
+    def set_preview(self, preview):
+        """标题中标明当前结果是否为预览"""
+        if preview == self.preview:
+            return
+        self.preview = preview
+        self.title_item.setPlainText(f"{self.title} (预览)" if preview else self.title)
+
+    def request_display_update(self):
+        """请求重新布局, 合并到下一轮事件循环中执行; 其他线程中经信号排队到界面线程"""
+        if QThread.currentThread() == QCoreApplication.instance().thread():
+            self.display_dispatcher.schedule(self)
+        else:
+            self.display_dispatcher.requested.emit(self)
+
     def reset(self):
         for socket in self.input_sockets + self.output_sockets:
             socket.reset()
@@ -158,15 +362,18 @@ class Node(QGraphicsItem):
         
         # 更新所有sockets
         for socket in self.output_sockets + self.input_sockets:
+            if socket.box is not None:
+                # 先更新输入框 (图片会改变其高度), 插座位置按新高度计算, 一次即可完成布局
+                socket.box.update_display()
             socket.update_position()
             socket.update()
             for edge in socket.edges:
                 edge.update_path()
             if socket.box is not None:
-                socket.box.update_display()
                 socket.box.update_position()
         
         # 计算最终高度
         self.content_height = max(self.inputs_height, self.outputs_height) + self.spacing
         self.height = self.title_height + self.content_height
+        self.update_shape()
         self.update()
@@ -1,14 +1,15 @@
 # socket.py
 from PySide6.QtWidgets import QGraphicsItem
 from PySide6.QtCore import QRectF, Qt, Signal
-from PySide6.QtGui import QBrush, QPen, QColor
+from PySide6.QtGui import QBrush, QPen, QColor, QImage
 from box import LineEditBox,ImageBox,SliderBox
+from image_bridge import qimage_to_mat
 
 class Socket(QGraphicsItem):
     
 
     def __init__(self, node, index=0, type=0, datatype=1,box_type=0):
-        super().__init__(node)
+        super().__init__(node.socket_layer)
         self.node = node
         self.index = index
         self.type = type  # 0表示输入，1表示输出
@@ -18,6 +19,8 @@ class Socket(QGraphicsItem):
         self.basic_height = 20  # 基础高度
         self.edges = []  # 存储多个Edge
         self._value = None  # 存储当前Socket的值
+        self.value_key = None  # 产生当前输出的缓存键
+        self.pinned = False  # 固定的插座执行后保留值, 不随中间结果释放
         self.box = None  # 存储当前Socket的输入框
         self.box_type = box_type  # 存储当前Socket的输入框类型
         # 初始化绘图属性
@@ -30,6 +33,12 @@ class Socket(QGraphicsItem):
         self.background_color = self.background_colors[self.datatype]
         self.outline_color = self.background_color.darker(130)
         self.outline_width = 2.0
+        self._bounding_rect = QRectF(
+            -self.radius - self.outline_width,
+            -self.radius - self.outline_width,
+            2 * (self.radius + self.outline_width),
+            2 * (self.radius + self.outline_width)
+        )
         self.pen = QPen(self.outline_color, self.outline_width)
         self.brush_background = QBrush(self.background_color)
         self.brush_background_unconnected = QBrush(QBrush(QColor("#2a2a2a")))
@@ -49,12 +58,19 @@ class Socket(QGraphicsItem):
 
     @value.setter
     def value(self, new_value):
+        if isinstance(new_value, QImage):
+            # 旧式节点可能写入QImage, 插座中统一保存数组; 复制为可写数组, 旧式节点会原地修改
+            new_value = qimage_to_mat(new_value).copy()
         self._value = new_value
         if self.box is not None:
-            # 抽象代码记得修改
-            self.node.update_display()
-            self.node.update_display()
-            
+            self.node.request_display_update()
+
+    @property
+    def param(self):
+        """输入框中的参数值, 不受连接影响"""
+        if self.box is not None:
+            return self.box.get_value()
+        return None
         
         
 
@@ -71,12 +87,7 @@ class Socket(QGraphicsItem):
             self.box = SliderBox(socket=self)
 
     def boundingRect(self):
-        return QRectF(
-            -self.radius - self.outline_width,
-            -self.radius - self.outline_width,
-            2 * (self.radius + self.outline_width),
-            2 * (self.radius + self.outline_width)
-        )
+        return self._bounding_rect
 
     def paint(self, painter, option, widget):
         if len(self.edges) > 0:  # 如果有连接
@@ -100,6 +111,7 @@ class Socket(QGraphicsItem):
 
     def reset(self):
         self._value = None
+        self.value_key = None
 
 
     def has_edge(self):
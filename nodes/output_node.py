@@ -3,29 +3,11 @@ from PySide6.QtGui import QPen, QBrush, QColor, QFont
 
 class NumberOutputNode(Node):
     def __init__(self):
-        super().__init__(
-            title="Number Output",
-            type=1002,
-            input_sockets=[{"datatype": 0, "box_type": 1}],
-            output_sockets=[]
-        )
+        super().__init__(type=1002)
 
-    def run(self):
-        """处理输入值并显示"""
-        for socket in self.input_sockets:
-            value = socket.value  # 直接使用socket的值，类型已在Box中判断
 
 class ImageOutputNode(Node):
     def __init__(self):
-        super().__init__(
-            title="Image Output",
-            type=2002,
-            input_sockets=[{"datatype": 1, "box_type": 2}],
-            output_sockets=[],
-        )
+        super().__init__(type=2002)
     
 
-    def run(self):
-        """处理输入值并显示"""
-        for socket in self.input_sockets:
-            value = socket.value  # 直接使用socket的值，类型已在Box中判断
@@ -0,0 +1,109 @@
+# process_pool.py
+"""多进程执行后端
+
+用于不释放GIL的纯Python节点。图像数组通过 multiprocessing.shared_memory 在进程间传递,
+不经过pickle; 工作进程常驻, 启动时即导入 cv2/numpy 和全部计算内核。
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from buffer_pool import BUFFER_POOL
+
+SHM_MIN_BYTES = 64 * 1024  # 小数组直接pickle更快
+
+
+def _warm_up():
+    """工作进程初始化: 提前导入计算内核"""
+    import kernels  # noqa: F401
+
+
+def _pack(value, blocks):
+    """将大数组写入共享内存, 返回描述符"""
+    if not isinstance(value, np.ndarray) or value.nbytes < SHM_MIN_BYTES:
+        return value
+    shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+    np.ndarray(value.shape, dtype=value.dtype, buffer=shm.buf)[...] = value
+    blocks.append(shm)
+    return ("__shm__", shm.name, value.shape, value.dtype.str)
+
+
+def _is_packed(value):
+    return isinstance(value, tuple) and len(value) == 4 and value[0] == "__shm__"
+
+
+def _unpack(value, blocks):
+    """根据描述符挂载共享内存, 返回数组视图"""
+    if not _is_packed(value):
+        return value
+    _, name, shape, dtype = value
+    shm = shared_memory.SharedMemory(name=name)
+    blocks.append(shm)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _run_kernel(node_type, packed_inputs, demand):
+    """在工作进程中执行内核, 输出写入新的共享内存, 由主进程负责释放"""
+    from kernels import run_kernel
+    input_blocks = []
+    output_blocks = []
+    error = None
+    try:
+        inputs = [_unpack(value, input_blocks) for value in packed_inputs]
+        outputs = run_kernel(node_type, inputs, demand)
+        packed_outputs = [_pack(value, output_blocks) for value in outputs]
+    except Exception as e:
+        # 异常的回溯会持有数组视图, 只保留文字信息
+        error = f"{type(e).__name__}: {e}"
+    # 输出可能是输入的视图, 先释放所有引用再关闭共享内存
+    inputs = outputs = None
+    for shm in input_blocks + output_blocks:
+        shm.close()
+    if error is not None:
+        for shm in output_blocks:
+            shm.unlink()
+        raise RuntimeError(error)
+    return packed_outputs
+
+
+class ProcessBackend:
+    def __init__(self, workers=None):
+        # 主进程先启动资源追踪进程, 工作进程与其共享, 共享内存的登记与注销才能配对
+        resource_tracker.ensure_running()
+        # 使用spawn避免在已有Qt线程的进程中fork
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+        )
+
+    def run(self, node_type, inputs, demand=None):
+        """在工作进程中执行内核并等待结果"""
+        input_blocks = []
+        try:
+            packed_inputs = [_pack(value, input_blocks) for value in inputs]
+            packed_outputs = self.pool.submit(_run_kernel, node_type, packed_inputs, demand).result()
+        finally:
+            for shm in input_blocks:
+                shm.close()
+                shm.unlink()
+        outputs = []
+        for value in packed_outputs:
+            if _is_packed(value):
+                blocks = []
+                shared = _unpack(value, blocks)
+                # 复制到池中的缓冲区, 共享内存随即释放
+                value = BUFFER_POOL.take(shared.shape, shared.dtype)
+                if value is None:
+                    value = shared.copy()
+                else:
+                    np.copyto(value, shared)
+                shared = None
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+            outputs.append(value)
+        return outputs
+
+    def shutdown(self):
+        self.pool.shutdown()
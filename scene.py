@@ -1,7 +1,24 @@
 from PySide6.QtWidgets import QGraphicsScene
-from PySide6.QtGui import QPainter,QColor,QBrush,QPen
-from PySide6.QtCore import QLine
+from PySide6.QtGui import QPainter,QColor,QBrush,QPen,QPixmap
+from PySide6.QtCore import QLine, QPoint, QRectF
 import math
+from topology import Topology, CycleError
+from node import LOD_FULL
+
+GRID_MIN_PIXELS = 6  # 网格线间距小于该像素数时不再绘制
+GRID_TILE_PIXELS = 512  # 网格图块的大致像素尺寸
+GRID_MAX_TILE = 2048  # 区块超过该像素数 (放大很多) 时直接绘制网格线
+SCENE_MARGIN = 5000  # 场景范围在全部节点之外留出的空白, 可以继续平移
+SCENE_MIN_SIZE = 20000  # 空场景的范围
+BSP_ITEMS_PER_LEAF = 8  # BSP索引每个叶子大致容纳的图形项数
+BSP_MIN_DEPTH = 5
+BSP_MAX_DEPTH = 18
+
+
+def count_items(item):
+    """图形项及其全部子项的数量"""
+    return 1 + sum(count_items(child) for child in item.childItems())
+
 
 class Scene(QGraphicsScene):
     def __init__(self, scene, node_factory, parent=None):
@@ -21,22 +38,129 @@ class Scene(QGraphicsScene):
         self.chunk_pen = QPen(self.chunk_color)
         self.chunk_pen.setWidth(2)
         self.setBackgroundBrush(QBrush(self.background_color))
+        self.grid_tile_cache = None  # ((缩放, 像素比), (网格图块, 覆盖的场景长度))
 
         self.nodes = []
         self.edges = []
-        self.scene_width = 64000
-        self.scene_height = 64000
+        self.topology = Topology()  # 增量维护的执行顺序
+        # 场景范围随节点自动调整, 为False时保持set_graphics_scene设置的固定范围
+        self.auto_scene_rect = True
+        self.item_count = 0  # 节点 (含子项) 与边的图形项数, 用于确定BSP深度
+        self.bsp_depth = 0
+        self.lod = LOD_FULL  # 当前的细节层次, 由视图按缩放设置, 节点与边各自保存一份
 
         self.initUI()
 
     def initUI(self):
-        self.set_graphics_scene(self.scene_width, self.scene_height)
+        self.fit_scene_rect()
 
     def set_graphics_scene(self,width,height):
+        self.auto_scene_rect = False
         self.setSceneRect(-width//2,-height//2,width,height)
 
+    def fit_scene_rect(self):
+        """按全部节点重新计算场景范围 (加载、清空后可以缩小)"""
+        if not self.auto_scene_rect:
+            return
+        half = SCENE_MIN_SIZE / 2
+        rect = QRectF(-half, -half, SCENE_MIN_SIZE, SCENE_MIN_SIZE)
+        for node in self.nodes:
+            rect = rect.united(node.sceneBoundingRect())
+        self.setSceneRect(rect.adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN))
+        self.tune_index()
+
+    def grow_scene_rect(self, rect):
+        """节点接近边界时扩大场景范围; 范围改变会重建索引, 因此留出余量, 平时不改变"""
+        if not self.auto_scene_rect:
+            return
+        scene_rect = self.sceneRect()
+        margin = SCENE_MARGIN / 2
+        if scene_rect.contains(rect.adjusted(-margin, -margin, margin, margin)):
+            return
+        self.setSceneRect(scene_rect.united(rect.adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN)))
+
+    def tune_index(self):
+        """按图形项数设置BSP深度, 每个叶子约BSP_ITEMS_PER_LEAF项; 深度不变时不重建索引"""
+        leaves = max(self.item_count / BSP_ITEMS_PER_LEAF, 1)
+        depth = min(max(math.ceil(math.log2(leaves)), BSP_MIN_DEPTH), BSP_MAX_DEPTH)
+        if depth != self.bsp_depth:
+            self.bsp_depth = depth
+            self.setBspTreeDepth(depth)
+
+    def set_lod(self, lod):
+        """切换细节层次, 只在层次改变时遍历节点"""
+        if lod == self.lod:
+            return
+        self.lod = lod
+        for node in self.nodes:
+            node.set_lod(lod)
+        for edge in self.edges:
+            edge.lod = lod
+        self.update()
+
     def drawBackground(self, painter, rect):
-        super().drawBackground(painter, rect)
+        """用预先绘制的网格图块铺满背景, 只在缩放改变时重新生成图块"""
+        transform = painter.worldTransform()
+        scale = transform.m11()
+        period = self.grid_size * self.chunk_size
+        if period * scale < GRID_MIN_PIXELS:
+            super().drawBackground(painter, rect)  # 缩得很小时只绘制背景色
+            return
+        if period * scale > GRID_MAX_TILE:
+            super().drawBackground(painter, rect)
+            self.draw_grid_lines(painter, rect)  # 放大很多时可见的网格线很少
+            return
+        pixmap, span = self.grid_tile(scale, painter.device().devicePixelRatioF())
+        # 图块按场景坐标对齐, 在设备坐标中以整数位置直接绘制 (不经过缩放变换)
+        first_x = math.floor(rect.left() / span)
+        first_y = math.floor(rect.top() / span)
+        last_x = math.ceil(rect.right() / span)
+        last_y = math.ceil(rect.bottom() / span)
+        painter.save()
+        painter.resetTransform()
+        for j in range(first_y, last_y):
+            y = round(transform.m22() * j * span + transform.dy())
+            for i in range(first_x, last_x):
+                x = round(scale * i * span + transform.dx())
+                painter.drawPixmap(QPoint(x, y), pixmap)
+        painter.restore()
+
+    def grid_tile(self, scale, ratio=1.0):
+        """当前缩放下的网格图块及其覆盖的场景长度
+
+        图块包含整数个区块, 约GRID_TILE_PIXELS像素; 小格间距小于GRID_MIN_PIXELS时只画区块线。
+        """
+        key = (round(scale, 6), ratio)
+        if self.grid_tile_cache is not None and self.grid_tile_cache[0] == key:
+            return self.grid_tile_cache[1]
+        period = self.grid_size * self.chunk_size
+        chunks = max(1, math.ceil(GRID_TILE_PIXELS / (period * scale)))
+        span = chunks * period
+        # 图块的像素尺寸取整, 每次绘制都重新对齐, 误差不会累积;
+        # 多出一个像素, 相邻图块取整后的间距比图块大时也不会留下空隙
+        size = max(1, round(span * scale))
+        pixmap = QPixmap(round((size + 1) * ratio), round((size + 1) * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(self.background_color)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(size / span, size / span)
+        if self.grid_size * scale >= GRID_MIN_PIXELS:
+            painter.setPen(self.grid_pen)
+            for v in range(self.grid_size, span, self.grid_size):
+                if v % period:
+                    painter.drawLine(QLine(0, v, span + period, v))
+                    painter.drawLine(QLine(v, 0, v, span + period))
+        # 区块线跨在图块的边界上, 两侧各画一半
+        painter.setPen(self.chunk_pen)
+        for v in range(0, span + 1, period):
+            painter.drawLine(QLine(0, v, span + period, v))
+            painter.drawLine(QLine(v, 0, v, span + period))
+        painter.end()
+        self.grid_tile_cache = (key, (pixmap, span))
+        return pixmap, span
+
+    def draw_grid_lines(self, painter, rect):
         painter.setPen(self.grid_pen)
 
         left = int(math.floor(rect.left()))
@@ -73,36 +197,83 @@ class Scene(QGraphicsScene):
         painter.setPen(self.chunk_pen)
         painter.drawLines(chunk_lines)
 
+    def stop_execution(self):
+        """修改节点与连接前停止正在执行的图并等待执行线程结束, 执行线程会遍历这些结构"""
+        for view in self.views():
+            if hasattr(view, "wait_for_graph"):
+                view.wait_for_graph()
+
     def add_node(self, node):
+        self.stop_execution()
         self.nodes.append(node)
+        self.topology.add_node(node)
         self.addItem(node)
+        node.set_lod(self.lod)
+        self.item_count += count_items(node)
+        self.grow_scene_rect(node.sceneBoundingRect())
+        self.tune_index()
 
     def add_edge(self, edge):
         # 仅在边两端插座都存在时添加
         if edge.start_socket is not None and edge.end_socket is not None:
             if edge not in self.edges:
+                self.stop_execution()
+                # 会形成循环时抛出CycleError, 并把Edge构造时加入的插座引用撤回
+                try:
+                    self.topology.add_edge(edge.output_socket.node, edge.input_socket.node)
+                except CycleError:
+                    for socket in (edge.start_socket, edge.end_socket):
+                        if edge in socket.edges:
+                            socket.edges.remove(edge)
+                    raise
                 self.edges.append(edge)
                 self.addItem(edge)
-                # 确保边被正确关联到插座
-                edge.start_socket.edges.append(edge)
-                edge.end_socket.edges.append(edge)
+                edge.lod = self.lod
+                self.item_count += 1
+                self.tune_index()
+                # 确保边被正确关联到插座 (Edge构造时可能已关联)
+                for socket in (edge.start_socket, edge.end_socket):
+                    if edge not in socket.edges:
+                        socket.edges.append(edge)
+                # 连接改变, 下游节点需要重新执行
+                edge.input_socket.node.mark_dirty()
 
     def remove_node(self, node):
         if node in self.nodes:
+            self.stop_execution()
             self.nodes.remove(node)
             # 断开所有关联的边
             for socket in node.input_sockets + node.output_sockets:
                 for edge in socket.edges.copy():  # 使用copy避免遍历时修改
                     self.remove_edge(edge)
+            self.topology.remove_node(node)
             self.removeItem(node)
+            self.item_count -= count_items(node)
+            self.tune_index()
 
     def remove_edge(self, edge):
         if edge in self.edges:
+            self.stop_execution()
             self.edges.remove(edge)
+            self.topology.remove_edge(edge.output_socket.node, edge.input_socket.node)
             # 清理socket引用
             if edge.start_socket and edge in edge.start_socket.edges:
                 edge.start_socket.edges.remove(edge)
             if edge.end_socket and edge in edge.end_socket.edges:
                 edge.end_socket.edges.remove(edge)
-            if edge in self.items():  # 更严格的场景检查
+            if edge.input_socket is not None:
+                edge.input_socket.node.mark_dirty()
+            if edge.scene() is self:
                 self.removeItem(edge)
+            self.item_count -= 1
+            self.tune_index()
+
+    def clear(self):
+        """清空场景, 同时清空节点与边的记录"""
+        self.stop_execution()
+        super().clear()
+        self.nodes.clear()
+        self.edges.clear()
+        self.topology = Topology()
+        self.item_count = 0
+        self.fit_scene_rect()
@@ -4,6 +4,7 @@ from PySide6.QtCore import QPointF
 from scene import Scene
 from node import Node
 from edge import Edge
+from topology import CycleError
 
 class SceneSerializer:
     @staticmethod
@@ -22,16 +23,21 @@ class SceneSerializer:
                     "x": node.scenePos().x(),
                     "y": node.scenePos().y()
                 },
+                # 输入框中的参数值, 图片保存为文件路径
+                "values": {
+                    "inputs": [SceneSerializer.dump_socket(socket) for socket in node.input_sockets],
+                    "outputs": [SceneSerializer.dump_socket(socket) for socket in node.output_sockets],
+                },
             }
             data["nodes"].append(node_data)
         
-        # 序列化边
+        # 序列化边 (起点统一为输出插座, 与拖动方向无关)
         for edge in scene.edges:
             edge_data = {
-                "start_node": scene.nodes.index(edge.start_socket.node),
-                "start_socket": edge.start_socket.index,
-                "end_node": scene.nodes.index(edge.end_socket.node),
-                "end_socket": edge.end_socket.index
+                "start_node": scene.nodes.index(edge.output_socket.node),
+                "start_socket": edge.output_socket.index,
+                "end_node": scene.nodes.index(edge.input_socket.node),
+                "end_socket": edge.input_socket.index
             }
             data["edges"].append(edge_data)
             
@@ -48,6 +54,11 @@ class SceneSerializer:
                 node_type=node_data["type"],
             )
             node.setPos(QPointF(node_data["position"]["x"], node_data["position"]["y"]))
+            values = node_data.get("values", {})
+            for socket, value in zip(node.input_sockets, values.get("inputs", [])):
+                SceneSerializer.load_socket(socket, value)
+            for socket, value in zip(node.output_sockets, values.get("outputs", [])):
+                SceneSerializer.load_socket(socket, value)
             scene.add_node(node)
             nodes.append(node)
         
@@ -58,7 +69,20 @@ class SceneSerializer:
             start_socket = start_node.output_sockets[edge_data["start_socket"]]
             end_socket = end_node.input_sockets[edge_data["end_socket"]]
             edge = Edge(start_socket, end_socket)
-            scene.add_edge(edge)
+            try:
+                scene.add_edge(edge)
+            except CycleError:
+                # 文件中的连接形成循环时跳过该连接, 继续加载其余部分
+                print(f"跳过形成循环的连接: 节点{edge_data['start_node']} -> 节点{edge_data['end_node']}")
+
+    @staticmethod
+    def dump_socket(socket):
+        return socket.box.dump_value() if socket.box is not None else None
+
+    @staticmethod
+    def load_socket(socket, value):
+        if socket.box is not None and value is not None:
+            socket.box.load_value(value)
 
 def save_scene_to_file(scene: Scene, filepath: str):
     """将场景保存到文件"""
@@ -71,3 +95,4 @@ def load_scene_from_file(scene: Scene, filepath: str):
     with open(filepath, "r", encoding="utf-8") as f:
         data = json.load(f)
     SceneSerializer.deserialize_scene(scene, data)
+    scene.fit_scene_rect()
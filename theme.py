@@ -12,6 +12,8 @@ class Color:
     NODE_TITLE = "#1F7D6B"
     NODE_TITLE_FONT = "#FFFFFF"
     IMAGE_NODE = "#c36060"
+    NODE_RUNNING = "#4FA3F7"
+    NODE_FAILED = "#FF3B30"
     
     # 组件颜色
     BOX_BACKGROUND = "rgba(70, 70, 70, 0.4)"
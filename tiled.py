@@ -0,0 +1,173 @@
+# tiled.py
+"""分块执行: 处理大于内存的图像
+
+源图像为 .npy 文件时以内存映射打开, 每次只读取一块 (其他格式仍整幅解码); 各块依次流过图像节点,
+节点按内核声明的邻域边距 (halo) 多读取周围的像素, 输出逐块写入磁盘上的 .npy 文件。
+同一时刻只保留一块的中间结果, 峰值内存约为 块大小 x 图的宽度, 与图像尺寸无关。
+
+图像节点都必须声明halo (输出与输入同尺寸, 每个像素只取决于邻域); 旋转、缩放等
+需要整幅图像的节点不能分块执行。不依赖图像的数字节点在分块之前执行一次。
+"""
+import os
+from numpy.lib.format import open_memmap
+from graph import Graph, upstream_cone, upstream_socket, is_output_node
+from kernels import NODE_SPECS, load_image, run_kernel
+
+TILE_SIZE = 1024
+
+
+def _is_image_node(node):
+    return any(socket.datatype == 1 for socket in node.input_sockets + node.output_sockets)
+
+
+def _expand(rect, margin, width, height):
+    """区域 (x0, y0, x1, y1) 每边扩展margin, 限制在图像范围内"""
+    x0, y0, x1, y1 = rect
+    return max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin)
+
+
+def _crop(value, rect):
+    """从覆盖value_rect的块中取出rect部分"""
+    array, value_rect = value
+    if array is None:
+        return None
+    x0, y0, x1, y1 = rect
+    return array[y0 - value_rect[1]:y1 - value_rect[1], x0 - value_rect[0]:x1 - value_rect[0]]
+
+
+class TiledExecutor:
+    """在图模型上分块执行全部图像输出"""
+    def __init__(self, model, output_dir, tile_size=TILE_SIZE):
+        self.model = model
+        self.output_dir = output_dir
+        self.tile_size = tile_size
+        self.outputs = model.output_nodes()
+        order = model.topology.order()
+        needed = upstream_cone(self.outputs)
+        self.order = [node for node in order if node in needed and _is_image_node(node)]
+        self.scalars = [node for node in order if node in needed and not _is_image_node(node)]
+        for node in self.order:
+            if node.input_sockets and not is_output_node(node) and NODE_SPECS[node.type]["halo"] is None:
+                raise ValueError(f"节点 {node.title} 需要整幅图像, 不能分块执行")
+        self.margins = self.plan_margins()
+        self.demand = {
+            node: frozenset(
+                socket.index for socket in node.output_sockets
+                if any(edge.input_socket is not None and edge.input_socket.node in needed for edge in socket.edges)
+            )
+            for node in self.order
+        }
+        self.consumers = {}  # 输出插座 -> 每块中读取它的下游插座数
+        for node in self.order:
+            for socket in node.input_sockets:
+                upstream = upstream_socket(socket)
+                if socket.datatype == 1 and upstream is not None:
+                    self.consumers[upstream] = self.consumers.get(upstream, 0) + 1
+
+    def plan_margins(self):
+        """每个节点的输出需要在块外多计算的像素: 下游的边距加上下游自身的halo"""
+        margins = {node: 0 for node in self.order}
+        for node in reversed(self.order):
+            halo = NODE_SPECS[node.type]["halo"] or 0
+            for socket in node.input_sockets:
+                upstream = upstream_socket(socket)
+                if socket.datatype == 1 and upstream is not None:
+                    margins[upstream.node] = max(margins[upstream.node], margins[node] + halo)
+        return margins
+
+    def open_sources(self):
+        """打开全部源图像, 返回 节点 -> 图像 (内存映射或数组) 与图像尺寸"""
+        sources = {}
+        for node in self.order:
+            if not node.input_sockets:
+                sources[node] = load_image(node.output_sockets[0].param)
+        shapes = {image.shape[:2] for image in sources.values() if image is not None}
+        if len(shapes) > 1:
+            raise ValueError("分块执行要求所有源图像尺寸相同")
+        if not shapes:
+            return sources, (0, 0)
+        height, width = shapes.pop()
+        return sources, (width, height)
+
+    def params(self, node):
+        """非图像输入的值: 连接时取上游数字节点的输出, 否则取参数; 图像输入的位置为None"""
+        values = []
+        for socket in node.input_sockets:
+            upstream = upstream_socket(socket)
+            if socket.datatype == 1:
+                values.append(None)
+            else:
+                values.append(upstream.value if upstream is not None else socket.param)
+        return values
+
+    def run(self):
+        """执行并返回 [(输出节点, 值)], 图像输出为写入磁盘的内存映射"""
+        if self.scalars:
+            Graph(self.model).execute(targets=self.scalars)
+        sources, (width, height) = self.open_sources()
+        params = {node: self.params(node) for node in self.order if node.input_sockets}
+        results = {}  # 输出节点 -> 内存映射
+        for y in range(0, height, self.tile_size):
+            for x in range(0, width, self.tile_size):
+                tile = (x, y, min(x + self.tile_size, width), min(y + self.tile_size, height))
+                self.run_tile(tile, (width, height), sources, params, results)
+        for image in results.values():
+            image.flush()
+        values = []
+        for node in self.outputs:
+            if node in results:
+                values.append((node, results[node]))
+            elif node.input_sockets and node.input_sockets[0].datatype != 1:
+                values.append((node, node.input_sockets[0].value))
+            else:
+                values.append((node, None))
+        return values
+
+    def run_tile(self, tile, size, sources, params, results):
+        """计算一块: 每个节点的输出覆盖块向外扩展其边距的区域, 最后一个读取者执行完后释放"""
+        values = {}  # 输出插座 -> (数组, 覆盖的区域)
+        pending = dict(self.consumers)
+        for node in self.order:
+            rect = _expand(tile, self.margins[node], *size)
+            if not node.input_sockets:
+                image = sources[node]
+                x0, y0, x1, y1 = rect
+                values[node.output_sockets[0]] = (None if image is None else image[y0:y1, x0:x1], rect)
+                continue
+            halo = NODE_SPECS[node.type]["halo"] or 0
+            input_rect = _expand(rect, halo, *size)
+            inputs = list(params[node])
+            for socket in node.input_sockets:
+                upstream = upstream_socket(socket)
+                if socket.datatype != 1 or upstream is None:
+                    continue
+                inputs[socket.index] = _crop(values[upstream], input_rect)
+                pending[upstream] -= 1
+                if pending[upstream] == 0:
+                    del values[upstream]
+            if is_output_node(node):
+                self.write_tile(node, inputs[0], tile, size, results)
+                continue
+            outputs = run_kernel(node.type, inputs, self.demand[node])
+            for socket, output in zip(node.output_sockets, outputs):
+                if socket in pending:
+                    values[socket] = (_crop((output, input_rect), rect), rect)
+
+    def write_tile(self, node, image, tile, size, results):
+        """写入输出文件, 第一块确定通道数与数据类型"""
+        if image is None:
+            return
+        output = results.get(node)
+        if output is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            index = self.outputs.index(node)
+            path = os.path.join(self.output_dir, f"output_{index}.npy")
+            output = open_memmap(path, mode="w+", dtype=image.dtype, shape=(size[1], size[0]) + image.shape[2:])
+            results[node] = output
+        x0, y0, x1, y1 = tile
+        output[y0:y1, x0:x1] = image
+
+
+def run_tiled(model, output_dir, tile_size=TILE_SIZE):
+    """分块执行图模型, 图像输出写入 output_dir/output_{序号}.npy"""
+    return TiledExecutor(model, output_dir, tile_size).run()
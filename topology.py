@@ -0,0 +1,108 @@
+# topology.py
+"""增量维护的拓扑序
+
+采用 Pearce-Kelly 算法: 每个节点有一个序号, 新增的边只在违反顺序时
+重排受影响区间内的节点, 图未改变时直接返回缓存的执行顺序。
+"""
+
+
+class CycleError(ValueError):
+    """连接会形成循环依赖"""
+
+
+class Topology:
+    def __init__(self):
+        self.ord = {}  # 节点 -> 序号, 上游节点的序号总是更小
+        self.successors = {}  # 节点 -> {下游节点: 边数}
+        self.predecessors = {}  # 节点 -> {上游节点: 边数}
+        self.next_ord = 0
+        self._order = None  # 缓存的执行顺序
+
+    def add_node(self, node):
+        if node in self.ord:
+            return
+        self.ord[node] = self.next_ord
+        self.next_ord += 1
+        self.successors[node] = {}
+        self.predecessors[node] = {}
+        self._order = None
+
+    def remove_node(self, node):
+        """删除节点及其所有连接, 剩余节点的顺序仍然有效"""
+        if node not in self.ord:
+            return
+        for successor in self.successors.pop(node):
+            del self.predecessors[successor][node]
+        for predecessor in self.predecessors.pop(node):
+            del self.successors[predecessor][node]
+        del self.ord[node]
+        self._order = None
+
+    def would_create_cycle(self, start, end):
+        """添加 start -> end 的连接是否会形成循环"""
+        if start is end:
+            return True
+        if self.ord[start] < self.ord[end]:
+            return False
+        return start in self._forward(end, self.ord[start])
+
+    def add_edge(self, start, end):
+        if start is end:
+            raise CycleError("节点不能连接到自身")
+        lower, upper = self.ord[end], self.ord[start]
+        if lower < upper:
+            forward = self._forward(end, upper)
+            if start in forward:
+                raise CycleError("检测到循环依赖，无法添加连接")
+            backward = self._backward(start, lower)
+            self._reorder(backward, forward)
+        counts = self.successors[start]
+        counts[end] = counts.get(end, 0) + 1
+        counts = self.predecessors[end]
+        counts[start] = counts.get(start, 0) + 1
+
+    def remove_edge(self, start, end):
+        counts = self.successors.get(start, {})
+        if counts.get(end, 0) > 1:
+            counts[end] -= 1
+            self.predecessors[end][start] -= 1
+        elif end in counts:
+            del counts[end]
+            del self.predecessors[end][start]
+
+    def order(self):
+        """执行顺序, 图未改变时直接返回缓存 (调用方不应修改)"""
+        if self._order is None:
+            self._order = sorted(self.ord, key=self.ord.get)
+        return self._order
+
+    def _forward(self, node, upper):
+        """从node出发沿下游可达且序号不超过upper的节点"""
+        visited = {node}
+        stack = [node]
+        while stack:
+            for successor in self.successors[stack.pop()]:
+                if successor not in visited and self.ord[successor] <= upper:
+                    visited.add(successor)
+                    stack.append(successor)
+        return visited
+
+    def _backward(self, node, lower):
+        """从node出发沿上游可达且序号不小于lower的节点"""
+        visited = {node}
+        stack = [node]
+        while stack:
+            for predecessor in self.predecessors[stack.pop()]:
+                if predecessor not in visited and self.ord[predecessor] >= lower:
+                    visited.add(predecessor)
+                    stack.append(predecessor)
+        return visited
+
+    def _reorder(self, backward, forward):
+        """受影响的节点重新分配原有的序号: 上游集合整体排在下游集合之前"""
+        backward = sorted(backward, key=self.ord.get)
+        forward = sorted(forward, key=self.ord.get)
+        slots = sorted(self.ord[node] for node in backward + forward)
+        for node, slot in zip(backward + forward, slots):
+            self.ord[node] = slot
+        self._order = None
@@ -1,11 +1,16 @@
+import os
 from PySide6.QtWidgets import QGraphicsView, QMenu
 from theme import StyleSheets
 from PySide6.QtGui import QPainter, QMouseEvent, QCursor,QAction
-from PySide6.QtCore import Qt, QPointF
+from PySide6.QtCore import Qt, QPointF, QTimer
+from shiboken6 import isValid
 from node_socket import Socket
+from box import ImageBox
 from edge import Edge
-from node import Node
+from node import Node, STATE_IDLE, STATE_RUNNING, STATE_FAILED, lod_for_scale
 from graph import Graph
+from graph_runner import GraphRunner
+from cache import ResultCache
 from node_factory import NodeFactory
 from commands import AddNodeCommand, AddEdgeCommand, RemoveNodeCommand, RemoveEdgeCommand,PasteCommand
 
@@ -13,12 +18,22 @@ MODE_NOOP = 1
 MODE_EDGE_DRAG = 2
 MODE_RUBBER_BAND = 3
 EDGE_DRAG_START_THRESHOLD = 10
+PREVIEW_IDLE_MS = 600  # 停止编辑后多久执行全分辨率计算
+# 视口刷新方式: 名称 -> (菜单文字, Qt模式)
+UPDATE_MODES = {
+    "smart": ("智能 (只重绘变化区域)", QGraphicsView.SmartViewportUpdate),
+    "minimal": ("最小区域", QGraphicsView.MinimalViewportUpdate),
+    "bounding": ("包围矩形", QGraphicsView.BoundingRectViewportUpdate),
+    "full": ("全部重绘", QGraphicsView.FullViewportUpdate),
+}
+DEFAULT_UPDATE_MODE = "smart"
 
 
 class View(QGraphicsView):
     def __init__(self, scene, undo_stack):
         super().__init__(scene)
         self.undo_stack = undo_stack  # 新增
+        self.update_mode = DEFAULT_UPDATE_MODE
         self.clipboard = None
         self.initUI()
         # scale
@@ -27,7 +42,7 @@ class View(QGraphicsView):
         self.zoom = 5
         self.zoom_clamp = False # 是否限制缩放范围
         self.zoom_step = 1 # 缩放步长
-        self.zoom_range = [0, 10] # 缩放范围
+        self.zoom_range = [-5, 10] # 缩放范围, 最小约0.1倍时可以总览数千个节点
         self.mode = MODE_NOOP
         
         # 拖动连接相关
@@ -36,11 +51,32 @@ class View(QGraphicsView):
         self.drag_start_pos = None
 
         self.node_factory = NodeFactory()
+        # 跨多次执行保留的结果缓存
+        self.result_cache = ResultCache()
+        # 并行执行独立分支的线程数
+        self.graph_workers = os.cpu_count() or 1
+        self.graph = None
+        self.runner = None  # 正在执行的GraphRunner
+        self.demand_driven = True  # 只执行通向输出节点的分支
+        self.release_intermediates = False  # 执行后释放中间结果以降低内存占用
+        self.fuse_nodes = True  # 融合连续的逐像素节点和几何节点
+        # 编辑参数时以代理分辨率实时预览, 停止编辑后再执行全分辨率计算
+        self.live_preview = True
+        self.pending_run = None  # 当前执行结束后要启动的执行: "preview" 或 "full"
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(PREVIEW_IDLE_MS)
+        self.idle_timer.timeout.connect(lambda: self.schedule_run("full"))
+        # 同一轮事件中的多次修改 (拖动滑块、加载场景) 合并为一次预览
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(0)
+        self.preview_timer.timeout.connect(lambda: self.schedule_run("preview"))
 
     def initUI(self):
         # 设置渲染提示：抗锯齿 文本抗锯齿 平滑图像变换
         self.setRenderHint(QPainter.Antialiasing | QPainter.TextAntialiasing | QPainter.SmoothPixmapTransform)
-        self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+        self.set_update_mode(self.update_mode)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)  # 关闭垂直滚动条
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)  # 关闭水平滚动条
         
@@ -50,6 +86,15 @@ class View(QGraphicsView):
         # 设置菜单样式
         self.setup_menu_style()
 
+    def set_update_mode(self, name):
+        """切换视口刷新方式, 见UPDATE_MODES"""
+        if name not in UPDATE_MODES:
+            print(f"未知的刷新方式: {name}")
+            return
+        self.update_mode = name
+        self.setViewportUpdateMode(UPDATE_MODES[name][1])
+        self.viewport().update()
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MiddleButton:
             self.MiddleButtonPress(event)
@@ -147,6 +192,10 @@ class View(QGraphicsView):
             return False
         if start_socket.node == end_socket.node:
             return False
+        # 连接时即拒绝会形成循环的连线
+        output_socket, input_socket = (start_socket, end_socket) if start_socket.type == 1 else (end_socket, start_socket)
+        if self.scene().topology.would_create_cycle(output_socket.node, input_socket.node):
+            return False
         return True
 
     def create_edge(self, start_socket, end_socket):
@@ -204,6 +253,11 @@ class View(QGraphicsView):
         
         menu = QMenu(self)
         menu.setStyleSheet(self.menu_style)
+        # 只计算该节点及其上游
+        run_action = QAction("执行到此节点", self)
+        run_action.triggered.connect(lambda: self.start_graph(targets=[item]))
+        menu.addAction(run_action)
+        menu.addSeparator()
         self.add_edit_actions_to_menu(menu)
         menu.exec_(self.mapToGlobal(event.pos()))
 
@@ -297,6 +351,8 @@ class View(QGraphicsView):
             clamped = True
         if not clamped or not self.zoom_clamp is False:
             self.scale(zoom_factor, zoom_factor)
+            # 缩放已使整个视口重绘, 此时切换层次不会再逐项计算刷新区域
+            self.scene().set_lod(lod_for_scale(self.transform().m11()))
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Delete:
@@ -417,21 +473,118 @@ class View(QGraphicsView):
             sockets_data.append(socket_data)
         return sockets_data
 
-    def start_graph(self):
-        if hasattr(self, 'graph') and self.graph is not None:
-            self.graph.reset()
-            self.graph.execute()
-            # 打印重新执行
-            print("Graph execution restarted")
+    def preview_width(self):
+        """与画布上图片框显示尺寸相当的预览宽度 (像素)"""
+        widths = [
+            socket.box.width
+            for node in self.scene().nodes
+            for socket in node.input_sockets + node.output_sockets
+            if isinstance(socket.box, ImageBox)
+        ]
+        if not widths:
+            return None
+        scale = self.transform().m11() * self.devicePixelRatioF()
+        return max(1, int(max(widths) * scale))
+
+    def request_preview(self):
+        """参数被修改: 立即预览, 编辑停止后执行全分辨率计算"""
+        if not self.live_preview:
             return
-            
-        # 创建Graph实例并执行
-        self.graph = Graph(self.scene())
-        self.graph.execute()
-        print("Graph execution started")
-        
+        self.preview_timer.start()
+        self.idle_timer.start()
+
+    def schedule_run(self, mode):
+        """正在执行时取消并在结束后启动, 否则立即启动"""
+        if self.runner is not None and self.runner.isRunning():
+            # 全分辨率的请求优先, 不被随后的预览请求覆盖
+            if self.pending_run != "full":
+                self.pending_run = mode
+            if self.runner.preview is not None or mode == "preview":
+                self.runner.cancel()
+            return
+        self.start_graph(preview=(mode == "preview"))
+
+    def on_runner_finished(self, runner):
+        # 结束的执行器随后由deleteLater释放; 期间可能已经启动了新的执行
+        if self.runner is runner:
+            self.runner = None
+        mode, self.pending_run = self.pending_run, None
+        if mode is not None:
+            self.schedule_run(mode)
+
+    def start_graph(self, targets=None, preview=False):
+        if self.runner is not None and self.runner.isRunning():
+            print("Graph is already running")
+            return
+        if not preview:
+            self.idle_timer.stop()
+        preview_width = self.preview_width() if preview else None
+        restarted = self.graph is not None
+        if self.graph is None:
+            # 创建Graph实例
+            self.graph = Graph(
+                self.scene(),
+                cache=self.result_cache,
+                workers=self.graph_workers,
+                demand_driven=self.demand_driven,
+                release_intermediates=self.release_intermediates,
+                fuse_nodes=self.fuse_nodes,
+            )
+        # 在工作线程中执行, 只重新执行被修改过的节点及其下游
+        self.runner = GraphRunner(self.graph, targets, self, preview=preview_width)
+        mode = f"preview {preview_width}px" if preview_width is not None else "full resolution"
+        # 排队送达的信号可能晚于节点被删除 (清空场景、导入)
+        self.runner.node_started.connect(lambda node: isValid(node) and node.set_state(STATE_RUNNING))
+        self.runner.node_finished.connect(lambda node: isValid(node) and (
+            node.set_state(STATE_IDLE), node.set_preview(preview_width is not None)))
+        self.runner.node_failed.connect(lambda node, error: isValid(node) and node.set_state(STATE_FAILED))
+        self.runner.completed.connect(
+            lambda: print(f"Graph execution finished ({mode}), cache: {self.result_cache.stats()}"))
+        self.runner.cancelled.connect(self.on_graph_cancelled)
+        self.runner.failed.connect(self.on_graph_failed)
+        runner = self.runner
+        self.runner.finished.connect(lambda: self.on_runner_finished(runner))
+        self.runner.finished.connect(self.runner.deleteLater)
+        self.runner.start()
+        print(f"Graph execution {'restarted' if restarted else 'started'} ({mode})")
+
+    def reset_running_states(self):
+        """执行中断后仍显示为执行中的节点恢复为空闲"""
+        for node in self.scene().nodes:
+            if node.state == STATE_RUNNING:
+                node.set_state(STATE_IDLE)
+
+    def on_graph_cancelled(self):
+        self.reset_running_states()
+        print("Graph execution cancelled")
+
+    def on_graph_failed(self, error):
+        # 失败的节点已标记为失败, 并行执行中同时在计算的节点不会收到完成信号
+        self.reset_running_states()
+        print(f"Graph execution failed: {error}")
+
+    def wait_for_graph(self):
+        """取消正在进行的执行并等待执行线程结束; 修改图的结构前调用, 执行线程会遍历节点与连接"""
+        if self.runner is not None and self.runner.isRunning():
+            self.runner.cancel()
+            self.runner.wait()
+
+    def shutdown_graph(self):
+        """关闭窗口或退出程序前调用: 不再启动新的执行, 等待当前执行结束"""
+        self.pending_run = None
+        self.preview_timer.stop()
+        self.idle_timer.stop()
+        self.wait_for_graph()
+
     def stop_graph(self):
-        if not hasattr(self, 'graph') or self.graph is None:
+        self.pending_run = None
+        self.preview_timer.stop()
+        self.idle_timer.stop()
+        if self.runner is not None and self.runner.isRunning():
+            # 不再调度新节点, 正在计算的节点完成后停止
+            self.runner.cancel()
+            return
+        if self.graph is None:
             print("No graph is running")
             return
         self.graph = None